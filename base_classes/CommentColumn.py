@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class CommentColumn:
+    '''
+    Comments of a data set stored as integer codes and a list
+    of unique comments (labels), since most rows have no comment
+    and the others repeat.
+    codes - int32 array, one code per row
+    labels - list of strings, labels[0] is always the empty comment,
+    so rows with comments are the ones with non-zero codes
+    Indexing with an array or a slice gives a CommentColumn
+    sharing the labels, indexing with an integer gives the comment.
+    '''
+    def __init__(self, codes=None, labels=None):
+        if codes is None: codes = np.zeros(0, dtype=np.int32)
+        if labels is None: labels = ['']
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.labels = labels
+
+    @classmethod
+    def fromBytes(cls, comments):
+        '''
+        encode the first string column returned by
+        InputReader.read_clf ((n_rows, n_string_columns) bytes array)
+        '''
+        column = comments[:, 0]
+        codes = np.zeros(column.shape[0], dtype=np.int32)
+        filled = np.flatnonzero(column != b'')
+        unique, inverse = np.unique(column[filled], return_inverse=True)
+        codes[filled] = inverse.ravel() + 1
+        labels = [''] + [u.decode('UTF-8') for u in unique]
+        return cls(codes, labels)
+
+    @classmethod
+    def concatenate(cls, columns):
+        '''
+        join columns, which may have different labels
+        '''
+        result = cls(labels=list(columns[0].labels))
+        codes = []
+        for column in columns:
+            mapping = result.encode(column.labels)
+            codes.append(mapping[column.codes])
+        result.codes = np.concatenate(codes)
+        return result
+
+    def encode(self, comments):
+        '''
+        codes of the comments (list of strings).
+        Comments that are not in labels yet are added to them
+        '''
+        index = dict((label, i) for i, label in enumerate(self.labels))
+        codes = np.zeros(len(comments), dtype=np.int32)
+        for i, comment in enumerate(comments):
+            if comment not in index:
+                index[comment] = len(self.labels)
+                self.labels.append(comment)
+            codes[i] = index[comment]
+        return codes
+
+    def nonEmpty(self):
+        '''
+        boolean mask of the rows with comments
+        '''
+        return self.codes != 0
+
+    def strings(self):
+        '''
+        comments of all rows as an array of strings
+        '''
+        return np.array(self.labels)[self.codes]
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.labels[self.codes[index]]
+        return CommentColumn(self.codes[index], self.labels)
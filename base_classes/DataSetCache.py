@@ -0,0 +1,128 @@
+import os
+import hashlib
+import numpy as np
+from TCI.base_classes.PropertyTable import PropertyTable
+from TCI.lib.logger import logger
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.TCI', 'cache')
+
+
+class DataSetCache:
+    '''
+    Binary cache of parsed clf files.
+    Each entry is a pair of files named after the hash of the
+    absolute path of the clf file:
+    <hash>.npy - values (column-major, so it can be memory-mapped
+    and every column is contiguous)
+    <hash>.npz - names, units, comments, properties of the test
+    and size and modification time of the clf file.
+    An entry is stale if the size or modification time of the
+    clf file changed. When the total size of the cache exceeds
+    max_size bytes, least recently used entries are deleted.
+    '''
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=500*1024**2):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def entryPath(self, fname):
+        '''
+        path of the cache entry without extension
+        '''
+        path = os.path.abspath(fname)
+        key = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def fileStamp(self, fname):
+        stat = os.stat(fname)
+        return stat.st_size, stat.st_mtime
+
+    def load(self, fname):
+        '''
+        Returns (names, units, values, comments, properties) or None if
+        the file is not in the cache or the entry is stale.
+        values are memory-mapped
+        '''
+        if self.max_size <= 0: return None
+        entry = self.entryPath(fname)
+        if not (os.path.isfile(entry + '.npy') and
+                os.path.isfile(entry + '.npz')):
+            return None
+        try:
+            with np.load(entry + '.npz') as meta:
+                size, mtime = self.fileStamp(fname)
+                if (int(meta['size']) != size or
+                        float(meta['mtime']) != mtime):
+                    logger.info('Cache entry for %s is stale' % (fname))
+                    self.remove(entry)
+                    return None
+                names = [str(n) for n in meta['names']]
+                units = [str(u) for u in meta['units']]
+                comments = meta['comments']
+                properties = PropertyTable()
+                properties.addEntries(
+                    zip([str(k) for k in meta['property_keys']],
+                        [str(v) for v in meta['property_values']]))
+            values = np.load(entry + '.npy', mmap_mode='r')
+        except (IOError, ValueError, KeyError) as e:
+            logger.warning('Broken cache entry for %s: %s' % (fname, e))
+            self.remove(entry)
+            return None
+        # mark as recently used
+        os.utime(entry + '.npz', None)
+        logger.info('Loaded %s from cache' % (fname))
+        return names, units, values, comments, properties
+
+    def save(self, fname, names, units, values, comments, properties):
+        '''
+        store parsed clf file.
+        properties - PropertyTable of the file
+        '''
+        if self.max_size <= 0: return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        entry = self.entryPath(fname)
+        size, mtime = self.fileStamp(fname)
+        try:
+            np.save(entry + '.npy', np.asfortranarray(values))
+            np.savez(entry + '.npz', names=np.array(names),
+                     units=np.array(units), comments=comments,
+                     property_keys=np.array(list(properties.entries.keys())),
+                     property_values=np.array(list(properties.entries.values())),
+                     size=size, mtime=mtime)
+        except (IOError, OSError) as e:
+            # e.g. the old entry is still mapped on windows
+            logger.warning('Could not cache %s: %s' % (fname, e))
+            return
+        logger.info('Saved %s to cache' % (fname))
+        self.evict()
+
+    def remove(self, entry):
+        for ext in ['.npy', '.npz']:
+            try:
+                if os.path.isfile(entry + ext):
+                    os.remove(entry + ext)
+            except OSError as e:
+                logger.warning('Could not remove %s: %s' % (entry + ext, e))
+
+    def evict(self):
+        '''
+        delete least recently used entries until the cache
+        fits into max_size
+        '''
+        entries = {}
+        for fname in os.listdir(self.cache_dir):
+            entry, ext = os.path.splitext(fname)
+            if ext not in ['.npy', '.npz']: continue
+            path = os.path.join(self.cache_dir, fname)
+            size, last_used = entries.get(entry, (0, 0))
+            if ext == '.npz':
+                last_used = os.path.getmtime(path)
+            entries[entry] = (size + os.path.getsize(path), last_used)
+
+        total_size = sum(size for size, last_used in entries.values())
+        by_last_use = sorted(entries.keys(), key=lambda e: entries[e][1])
+        for entry in by_last_use:
+            if total_size <= self.max_size: break
+            logger.info('Removing %s from cache' % (entry))
+            self.remove(os.path.join(self.cache_dir, entry))
+            total_size -= entries[entry][0]
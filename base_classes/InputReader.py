@@ -2,112 +2,540 @@ import numpy as np
 import io
 import re
 import warnings
+from itertools import islice
+from collections import OrderedDict
+from TCI.base_classes.PropertyTable import PropertyTable
 from TCI.lib.logger import logger
 
+NEWLINE = ord('\n')
+TAB = ord('\t')
+CR = ord('\r')
+SPACE = ord(' ')
+# characters that can be in a tab-separated row of numbers
+NUMBER_CHARS = np.zeros(256, dtype=bool)
+NUMBER_CHARS[np.frombuffer(b'0123456789+-.eE \t\nnaNAifIFtyTY',
+                           dtype=np.uint8)] = True
+# and the carriage returns of windows line ends
+ROW_CHARS = NUMBER_CHARS.copy()
+ROW_CHARS[CR] = True
+
 class InputReader:
     max_n_rows = 1e5
+    chunk_size = 50000      # rows per chunk in streaming mode
+    sample_size = 100       # rows used to guess the types of columns
     def __init__(self):
         pass
 
     def read_clf(self, fname, headerexpr="Time.*Sig1[^\n]+",
-                 compression=None):
-
+                 compression=None, columns=None):
+        '''
+        columns - names of the columns to read (all if None).
+        Names and units of the columns that were not read are
+        stored in self.skipped_columns
+        '''
+        self.skipped_columns = OrderedDict()
+        if columns is not None:
+            return self.read_clf_columns(fname, headerexpr, columns)
         with io.open(fname, 'r', errors='replace') as f:
             text = f.read()
-        self.text = text
         headerpos = self.findHeader(text, expr=headerexpr)
         if headerpos is None:
             return "No header", None
+        # keep only the parsed properties, not the text of the file
+        self.properties = PropertyTable(text[:headerpos[0]])
 
         header = text[headerpos[0]:headerpos[1]]
         names, units = self.parseHeader(header)
+        string_columns = self.findStringColumns(header)
 
         raw_table_text = text[headerpos[1]:]
-        values, comments = self.readUnstructuredTable(raw_table_text)
+        header_line = text.count('\n', 0, headerpos[0])
+        values, comments = self.readUnstructuredTable(raw_table_text,
+                                                      string_columns,
+                                                      line_offset=header_line)
         return names, units, values, comments
 
+    def read_clf_columns(self, fname, headerexpr, columns):
+        '''
+        read_clf that parses only the cells of the given columns.
+        Offsets of all rows and cells are found in the bytes of
+        the file at once, and only the bytes of the requested cells
+        are converted to numbers. Files with irregular rows are read
+        with readUnstructuredTable, which finds the bad rows
+        '''
+        with io.open(fname, 'rb') as f:
+            raw = f.read()
+        match = re.search(headerexpr.encode(), raw)
+        if match is None:
+            return "No header", None
+        preamble = raw[:match.start()].decode(errors='replace')
+        self.properties = PropertyTable(preamble)
+
+        header = raw[match.start():match.end()].decode(errors='replace')
+        header = header.rstrip('\r')
+        names, units = self.parseHeader(header)
+        string_columns = self.findStringColumns(header)
+
+        missing = [c for c in columns if c not in names]
+        if missing:
+            logger.warning('No columns %s in %s' % (missing, fname))
+        number_columns = [j for j in range(len(names)) if names[j] in columns]
+        for j in range(len(names)):
+            if j not in number_columns:
+                self.skipped_columns[names[j]] = units[j]
+        names = [names[j] for j in number_columns]
+        units = [units[j] for j in number_columns]
+
+        self.bad_lines = []
+        data = np.frombuffer(raw, dtype=np.uint8)[match.end():]
+        table = self.readCells(data, string_columns, number_columns)
+        if table is None:
+            text = raw[match.end():].decode(errors='replace')
+            header_line = raw.count(b'\n', 0, match.start())
+            table = self.readUnstructuredTable(text, string_columns,
+                                               number_columns, header_line)
+        values, comments = table
+        return names, units, values, comments
+
+    def readCells(self, data, string_columns, number_columns):
+        '''
+        parse the cells of the number columns with indices
+        number_columns (counting only number columns) and the string
+        columns from uint8 array data of a tab-separated table.
+        Returns values, comments as readUnstructuredTable or None
+        if rows have different numbers of cells, any number cell
+        has characters that can not be in a number or a requested
+        cell is empty, so that readUnstructuredTable keeps the same
+        rows as a read of all columns
+        '''
+        cells = self._cellOffsets(data)
+        if cells is None:
+            return None
+        starts, ends = cells
+        n_rows, n_columns = starts.shape
+        string_columns = sorted(j for j in string_columns if j < n_columns)
+        numbers = [j for j in range(n_columns) if j not in string_columns]
+        if len(numbers) <= max(number_columns + [-1]):
+            return None
+        selected = [numbers[j] for j in number_columns]
+        if n_rows == 0 or selected == []:
+            return None
+
+        # a bad character in any number cell (requested or not) drops
+        # the row in a full read, so it has to be dropped here too
+        bad = np.flatnonzero(~ROW_CHARS[data])
+        cell = np.searchsorted(starts.ravel(), bad, side='right') - 1
+        in_numbers = ~np.isin(cell % n_columns, string_columns)
+        if (in_numbers & (cell >= 0)).any():
+            return None
+        if (ends[:, selected] == starts[:, selected]).any():
+            return None
+        text = self._gatherCells(data, starts, ends, selected, TAB)
+        values = np.fromstring(text.tobytes().decode(), sep='\t')
+        if values.size != n_rows*len(selected):
+            return None
+        values = values.reshape(n_rows, len(selected))
+
+        if string_columns == []:
+            return values, None
+        text = self._gatherCells(data, starts, ends, string_columns,
+                                 NEWLINE)
+        cells = text.tobytes().decode(errors='replace').split('\n')[:-1]
+        comments = np.array([c.strip().encode() for c in cells],
+                            dtype=bytes)
+        return values, comments.reshape(n_rows, len(string_columns))
+
+    def _cellOffsets(self, data):
+        '''
+        (n_rows, n_columns) arrays of the positions of the first
+        character and of the character after every cell of the table
+        in uint8 array data. Blank lines are skipped.
+        None if the rows have different numbers of cells
+        '''
+        newlines = np.flatnonzero(data == NEWLINE)
+        starts = np.concatenate([[0], newlines + 1])
+        ends = np.append(newlines, data.size)
+        # without the carriage return of windows line ends
+        ends[ends > starts] -= data[ends[ends > starts] - 1] == CR
+        not_empty = ends > starts
+        starts = starts[not_empty]
+        ends = ends[not_empty]
+        n_rows = starts.shape[0]
+        tabs = np.flatnonzero(data == TAB)
+        if n_rows == 0 or tabs.size % n_rows != 0:
+            return None
+        # every row has the same number of tabs if the tabs
+        # of every row of the reshaped array lie in that row
+        tabs = tabs.reshape(n_rows, tabs.size // n_rows)
+        if tabs.size > 0 and ((tabs[:, 0] < starts).any() or
+                              (tabs[:, -1] >= ends).any()):
+            return None
+        cell_starts = np.column_stack([starts, tabs + 1])
+        cell_ends = np.column_stack([tabs, ends])
+        return cell_starts, cell_ends
+
+    def _gatherCells(self, data, starts, ends, columns, delimiter):
+        '''
+        uint8 array of the cells of given columns of all rows,
+        every cell is followed by the delimiter
+        '''
+        start = starts[:, columns].ravel()
+        length = ends[:, columns].ravel() - start + 1
+        stop = np.cumsum(length)
+        index = np.arange(stop[-1]) - np.repeat(stop - length - start,
+                                                length)
+        text = data[np.minimum(index, data.size - 1)]
+        text[stop - 1] = delimiter
+        return text
+
+    def read_clf_chunks(self, fname, headerexpr="Time.*Sig1[^\n]+",
+                        chunk_size=None):
+        '''
+        Streaming version of read_clf.
+        Reads the file line by line until the header is found,
+        then yields (names, units, values, comments) for every
+        chunk_size rows of the table. Only the lines before the
+        header are kept (to parse self.properties from them),
+        so the memory needed does not depend on the file size.
+        After the first chunk self.row_length holds the average
+        length of a table row in characters.
+        '''
+        if chunk_size is None: chunk_size = self.chunk_size
+        with io.open(fname, 'r', errors='replace') as f:
+            preamble = []
+            for line in f:
+                if self.findHeader(line, expr=headerexpr) is not None:
+                    header = line.rstrip('\r\n')
+                    break
+                preamble.append(line)
+            else:
+                raise IOError("No header in %s" % (fname))
+            self.properties = PropertyTable(''.join(preamble))
+
+            names, units = self.parseHeader(header)
+            string_columns = self.findStringColumns(header)
+            self.row_length = None
+            lines_read = len(preamble) + 1
+            while True:
+                lines = list(islice(f, chunk_size))
+                if lines == []:
+                    break
+                raw_table_text = ''.join(lines)
+                if self.row_length is None:
+                    self.row_length = len(raw_table_text)/len(lines)
+                values, comments = self.readUnstructuredTable(
+                    raw_table_text, string_columns, line_offset=lines_read)
+                lines_read += len(lines)
+                if values.shape[0] > 0:
+                    yield names, units, values, comments
+
+    def read_clf_tail(self, fname, offset, string_columns):
+        '''
+        Read rows that were appended to the file after
+        byte offset (for files that are still being written).
+        Only complete lines are read, an unfinished last line
+        is left for the next call.
+        Returns values, comments and the offset of the first
+        byte that was not read
+        '''
+        with io.open(fname, 'rb') as f:
+            f.seek(offset)
+            new_bytes = f.read()
+        end = new_bytes.rfind(b'\n') + 1
+        text = new_bytes[:end].decode(errors='replace')
+        values, comments = self.readUnstructuredTable(text, string_columns)
+        return values, comments, offset + end
+
     def findProperty(self, expr):
-        position = self.findHeader(self.text, expr)
-        text = self.text[position[1]:]
-        expr = "[^\n]+"
-        match = re.search(expr, text)
-        param = text[match.start(): match.end()]
-        return param
+        return self.properties.findProperty(expr)
 
-    def readUnstructuredTable(self, text):
+    def readUnstructuredTable(self, text, string_columns=None,
+                              number_columns=None, line_offset=0):
         '''
         Reads a piece of text (string) that contains
-        a table of data, some of which are numbers
-        and some are strings
-        '''
-        # create a byte object cause that's what
-        # genfromtxt gets
-        data_bytes = io.BytesIO(text.encode())
-        raw_data = np.genfromtxt(data_bytes, delimiter="\t",
-                                 dtype=None)
-        types = self._checkForConsistency(raw_data)
-
-        # get types of the data in the table
-        n_float_columns = 0
-        n_string_columns = 0
-        for t in types:
-            if (t == np.float64):
-                n_float_columns += 1
-            elif (t == np.string_):
-                n_string_columns += 1
-            else:
-                raise IOError("unknown type encountered")
+        a tab-delimited table of data, some columns of which
+        are numbers and some are strings.
+        string_columns - indices of the string columns. if None,
+        they are guessed from a sample of rows of the table
+        number_columns - indices of the number columns to return
+        (counting only number columns), all if None
+        line_offset - number of lines in the file before the text
+        Rows with a wrong number of cells or with cells that are
+        not numbers are skipped, their line numbers are logged
+        and stored in self.bad_lines. Empty number cells are nan.
+        The rows are checked one by one only if the table can not
+        be converted at once (see _readRegularTable)
+        Returns:
+            number_data - (n_rows, n_float_columns) float64 array
+            string_data - (n_rows, n_string_columns) bytes array
+            or None if there are no string columns
+        '''
+        self.bad_lines = []
+        # split the body into rows once, drop blank lines
+        # (the header line leaves an empty one at the top)
+        lines = [l for l in text.splitlines() if l.strip()]
+        n_lines = len(lines)
+        if n_lines == 0:
+            return np.zeros([0, 0]), None
+        table = self._readRegularTable(lines, string_columns,
+                                       number_columns)
+        if table is not None:
+            return table
 
-        n_rows = raw_data.shape[0]
-        n_columns = len(raw_data[0])
+        # rows that have the usual number of cells
+        n_cells = self._countCells(lines)
+        n_columns = np.bincount(n_cells).argmax()
+        row_ids = np.flatnonzero(n_cells == n_columns)
+        if row_ids.size < n_lines:
+            lines = [lines[i] for i in row_ids]
 
-        number_data = np.zeros([n_rows, n_float_columns])
-        if (n_string_columns > 0):
-            string_data = np.empty([n_rows, n_string_columns],
-                                   dtype="S10")
+        if string_columns is None:
+            string_columns = self._guessStringColumns(lines, n_columns)
+        string_columns = sorted(string_columns)
+        n_string_columns = len(string_columns)
+        n_float_columns = n_columns - n_string_columns
+
+        # cut the string cells out of each row, so that the rest
+        # of the row is pure numbers
+        if n_string_columns == 0:
+            number_lines = lines
+            string_cells = None
+        elif string_columns == list(range(n_float_columns, n_columns)):
+            # usual case: comments are the last column(s)
+            split = [l.rsplit('\t', n_string_columns) for l in lines]
+            number_lines = [s[0] for s in split]
+            string_cells = [s[1:] for s in split]
         else:
-            string_data = None
+            number_lines = []
+            string_cells = []
+            for l in lines:
+                cells = l.split('\t')
+                string_cells.append([cells[j] for j in string_columns])
+                number_lines.append('\t'.join(
+                    c for j, c in enumerate(cells)
+                    if j not in string_columns))
+
+        # rows with characters that can not be in a number
+        invalid, empty = self._checkNumbers(number_lines)
+        if invalid.any():
+            keep = np.flatnonzero(~invalid)
+            number_lines = [number_lines[i] for i in keep]
+            if string_cells is not None:
+                string_cells = [string_cells[i] for i in keep]
+            row_ids = row_ids[keep]
+            empty = empty[keep]
+        for i in np.flatnonzero(empty):
+            number_lines[i] = re.sub(r'^(?=\t)|(?<=\t)(?=\t|$)', 'nan',
+                                     number_lines[i])
 
-        # write data into arrays
-        for i in range(n_rows):
-            row = raw_data[i]
-            fj = 0  # current float column number
-            sj = 0  # current string column number
-            for j in range(n_columns):
-                if (types[j] == np.float64):
-                    number_data[i, fj] = row[j]
-                    fj += 1
-                elif (types[j] == np.string_ and
-                      n_string_columns > 0):
-                    string_data[i, sj] = row[j]
-                    sj += 1
+        # all number cells are parsed, so that the same rows are
+        # kept whichever columns are requested
+        number_data, parsed = self._parseNumbers(number_lines,
+                                                 n_float_columns)
+        if number_columns is not None:
+            number_data = number_data[:, number_columns]
+        if not parsed.all():
+            keep = np.flatnonzero(parsed)
+            if string_cells is not None:
+                string_cells = [string_cells[i] for i in keep]
+            row_ids = row_ids[keep]
+
+        if row_ids.size < n_lines:
+            bad_ids = np.setdiff1d(np.arange(n_lines), row_ids)
+            self.bad_lines = self._lineNumbers(text, bad_ids, line_offset)
+            logger.warning('Skipped %d bad rows, lines: %s' %
+                           (len(self.bad_lines),
+                            ', '.join(str(n) for n in self.bad_lines[:20])))
+
+        n_rows = row_ids.size
+        if n_string_columns > 0:
+            string_data = np.array(
+                [[c.strip().encode() for c in row] for row in string_cells],
+                dtype=bytes)
+            string_data = string_data.reshape(n_rows, n_string_columns)
+        else:
+            string_data = None
 
         return number_data, string_data
 
-    def _checkForConsistency(self, table):
+    def _readRegularTable(self, lines, string_columns, number_columns):
         '''
-        checks whether each element of columns
-        have particulare types
-        Returns:
-            type: list
-                list of type of all columns
-        Raises:
-            AssertionError
-                if some column element types are inconsistent
-        '''
-        n_rows = table.shape[0]
-        n_columns = len(table[0])
-        types = []
-        for i in range(n_rows):
-            row = table[i]
-            assert len(row) == n_columns
-            for j in range(n_columns):
-                if (i == 0):
-                    types.append(type(row[j]))
-                else:
-                    assert type(row[j]) == types[j], \
-                        "%d-the column is inconsistent"
-        return types
+        convert a table without bad rows: all number cells are
+        parsed at once after checking that every row has the same
+        number of cells with one entry each (see _checkCells).
+        Returns None if that fails (bad rows, empty cells) or if
+        the string columns are not known or not the last ones
+        '''
+        if string_columns is None:
+            return None
+        n_lines = len(lines)
+        n_columns = lines[0].count('\t') + 1
+        string_columns = sorted(string_columns)
+        n_string_columns = len(string_columns)
+        n_float_columns = n_columns - n_string_columns
+        if n_string_columns == 0:
+            number_text = '\n'.join(lines)
+            string_cells = None
+        elif string_columns == list(range(n_float_columns, n_columns)):
+            split = [l.rsplit('\t', n_string_columns) for l in lines]
+            number_text = '\n'.join(s[0] for s in split)
+            string_cells = [s[1:] for s in split]
+        else:
+            return None
+        if not self._checkCells(number_text, n_lines, n_float_columns):
+            return None
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', DeprecationWarning)
+                number_data = np.fromstring(number_text, sep='\t')
+        except ValueError:
+            return None
+        if number_data.size != n_lines*n_float_columns:
+            return None
+        number_data = number_data.reshape(n_lines, n_float_columns)
+        if number_columns is not None:
+            number_data = number_data[:, number_columns]
+
+        if string_cells is None:
+            return number_data, None
+        string_data = np.array(
+            [[c.strip().encode() for c in row] for row in string_cells],
+            dtype=bytes)
+        return number_data, string_data.reshape(n_lines, n_string_columns)
+
+    def _checkCells(self, text, n_rows, n_columns):
+        '''
+        whether every one of n_rows rows of tab-separated text has
+        n_columns cells and every cell one entry without spaces,
+        so that np.fromstring gives one value per cell or fails.
+        (checked for all cells at once)
+        '''
+        if n_columns == 0:
+            return False
+        data = np.frombuffer(text.encode(errors='replace') + b'\n',
+                             dtype=np.uint8)
+        separator = (data == TAB) | (data == NEWLINE)
+        blank = separator | (data == SPACE)
+        separators = np.flatnonzero(separator)
+        if separators.size != n_rows*n_columns:
+            return False
+        # rows end after every n_columns cells and nowhere else
+        row_ends = separators[n_columns-1::n_columns]
+        if (data[row_ends] != NEWLINE).any() or \
+                np.count_nonzero(data == NEWLINE) != n_rows:
+            return False
+        # first characters of the entries: one in every cell if they
+        # alternate with the separators
+        entries = np.flatnonzero(~blank[1:] & blank[:-1]) + 1
+        if not blank[0]:
+            entries = np.concatenate([[0], entries])
+        return (entries.size == separators.size and
+                bool((entries < separators).all()) and
+                bool((entries[1:] > separators[:-1]).all()))
+
+    def _countCells(self, lines):
+        '''
+        number of tab-separated cells in every row
+        (counted for all rows at once)
+        '''
+        data = self._toBytes(lines)
+        newlines = np.flatnonzero(data == NEWLINE)
+        tabs = np.flatnonzero(data == TAB)
+        row_of_tab = np.searchsorted(newlines, tabs)
+        return np.bincount(row_of_tab, minlength=len(lines)) + 1
+
+    def _checkNumbers(self, lines):
+        '''
+        find rows of tab-separated numbers that contain characters
+        which can not be in a number and rows with empty cells
+        (checked for all rows at once)
+        Returns two boolean arrays
+        '''
+        data = self._toBytes(lines)
+        newlines = np.flatnonzero(data == NEWLINE)
+        invalid = np.zeros(len(lines), dtype=bool)
+        bad_chars = np.flatnonzero(~NUMBER_CHARS[data])
+        invalid[np.searchsorted(newlines, bad_chars)] = True
+
+        # an empty cell is a tab at the start of a row, after
+        # another tab or before the end of a row
+        empty = np.zeros(len(lines), dtype=bool)
+        tabs = data == TAB
+        previous = np.concatenate([[NEWLINE], data[:-1]])
+        following = np.concatenate([data[1:], [NEWLINE]])
+        empty_cells = np.flatnonzero(
+            tabs & ((previous == NEWLINE) | (previous == TAB) |
+                    (following == NEWLINE)))
+        empty[np.searchsorted(newlines, empty_cells)] = True
+        return invalid, empty
+
+    def _toBytes(self, lines):
+        '''
+        rows joined into a uint8 array, every row ends with a newline
+        '''
+        text = '\n'.join(lines) + '\n'
+        return np.frombuffer(text.encode(errors='replace'), dtype=np.uint8)
+
+    def _lineNumbers(self, text, ids, line_offset=0):
+        '''
+        line numbers in the file of the non-blank rows with given indices
+        '''
+        non_blank = [i for i, l in enumerate(text.splitlines()) if l.strip()]
+        return [line_offset + non_blank[i] + 1 for i in ids]
+
+    def _parseNumbers(self, lines, n_columns):
+        '''
+        convert list of tab-separated rows of numbers into
+        a contiguous (n_rows, n_columns) float64 array in bulk.
+        If that fails (e.g. a cell like 1.2.3), the rows are
+        converted one by one to find the ones that can not be parsed.
+        Returns the array and a boolean array of the parsed rows
+        '''
+        n_rows = len(lines)
+        parsed = np.ones(n_rows, dtype=bool)
+        if n_columns == 0:
+            return np.zeros([n_rows, 0]), parsed
+        try:
+            number_data = np.fromstring('\n'.join(lines), sep='\t')
+        except ValueError:
+            number_data = None
+        if (number_data is not None and
+                number_data.size == n_rows*n_columns):
+            return number_data.reshape(n_rows, n_columns), parsed
+
+        rows = []
+        for i, l in enumerate(lines):
+            try:
+                row = [float(c) for c in l.split('\t')]
+            except ValueError:
+                row = []
+            if len(row) == n_columns:
+                rows.append(row)
+            else:
+                parsed[i] = False
+        number_data = np.array(rows, dtype=np.float64)
+        return number_data.reshape(len(rows), n_columns), parsed
+
+    def _guessStringColumns(self, lines, n_columns):
+        '''
+        indices of columns that are not numbers, judging by
+        at most sample_size rows evenly spaced in the table.
+        Columns that are empty in the sample are strings
+        (like comments)
+        '''
+        step = max(len(lines) // self.sample_size, 1)
+        sample = [l.split('\t') for l in lines[::step]]
+        string_columns = []
+        for j in range(n_columns):
+            cells = [row[j] for row in sample if row[j].strip() != '']
+            try:
+                [float(cell) for cell in cells]
+            except ValueError:
+                string_columns.append(j)
+                continue
+            if cells == []:
+                string_columns.append(j)
+        return string_columns
 
     def findHeader(self, text, expr="Time.*Sig1[^\n]+"):
         '''
@@ -119,6 +547,14 @@ class InputReader:
             return None
         return [match.start(), match.end()]
 
+    def findStringColumns(self, header):
+        '''
+        indices of header entries without units
+        (e.g. Comments). these columns contain strings
+        '''
+        entries = header.split("\t")
+        return [j for j, e in enumerate(entries) if len(e.split()) == 1]
+
     def parseHeader(self, header):
         '''
 	    Parces header of data
@@ -146,6 +582,18 @@ class InputReader:
 
         return names, units
 
+def parse_clf(fname, headerexpr="Time.*Sig1[^\n]+"):
+    '''
+    read_clf for worker processes of a process pool
+    (must be a module-level function to be picklable).
+    Returns names, units, values, comments and PropertyTable
+    '''
+    reader = InputReader()
+    clf_data = reader.read_clf(fname, headerexpr)
+    if clf_data[0] == "No header":
+        raise IOError("No header in %s" % (fname))
+    return clf_data + (reader.properties,)
+
 if __name__ == "__main__":
     fname = "_Training_Pc=1500 psi Sonic " + \
         "endcaps_Berea Mechanical Testing _2015-04-27_001.clf"
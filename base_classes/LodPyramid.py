@@ -0,0 +1,97 @@
+import numpy as np
+from TCI.lib.functions import append_rows
+
+
+class LodPyramid:
+    '''
+    Level of detail pyramid of a data column for drawing long curves.
+    Level k splits the rows into buckets of base*2**k rows and
+    stores indices of the minimum and the maximum in every bucket.
+    Drawing only these rows of a bucket per pixel looks the same as
+    drawing all rows, so the cost depends on the width of the plot
+    and not on the number of rows.
+    Levels are kept in buffers with spare room, so rows appended
+    to the column are added with extend in O(new rows) on average.
+    '''
+    base = 8        # rows in a bucket of the first level
+
+    def __init__(self, column):
+        self.n_rows = 0
+        self.levels = []
+        self.buffers = []   # [imin buffer, imax buffer] of every level
+        self.extend(column)
+
+    def extend(self, column):
+        '''
+        update the levels after rows were appended to the column
+        (column holds all rows). Only the buckets with new rows
+        and the buckets above them are recomputed
+        '''
+        n_old = self.n_rows
+        self.n_rows = column.shape[0]
+        if self.n_rows < 2*self.base: return
+        if self.levels == []: n_old = 0
+        # first bucket with new rows (the last old one may be partial)
+        first = n_old // self.base
+        start = first*self.base
+        n_full = (self.n_rows - start) // self.base
+        body = column[start:start + n_full*self.base].reshape(n_full,
+                                                              self.base)
+        offsets = start + np.arange(n_full)*self.base
+        imin = offsets + body.argmin(axis=1)
+        imax = offsets + body.argmax(axis=1)
+        tail_start = start + n_full*self.base
+        if tail_start < self.n_rows:
+            tail = column[tail_start:]
+            imin = np.append(imin, tail_start + tail.argmin())
+            imax = np.append(imax, tail_start + tail.argmax())
+        self._setLevel(0, first, imin, imax)
+        # every next level merges pairs of buckets
+        level = 0
+        while self.levels[level][0].shape[0] > 1:
+            first //= 2
+            lower_min, lower_max = self.levels[level]
+            imin = self._merge(column, lower_min[2*first:], np.less)
+            imax = self._merge(column, lower_max[2*first:], np.greater)
+            level += 1
+            self._setLevel(level, first, imin, imax)
+
+    def _setLevel(self, level, first, imin, imax):
+        '''
+        replace buckets of a level from bucket first on
+        '''
+        if level == len(self.buffers):
+            self.buffers.append([np.zeros(0, dtype=np.int32),
+                                 np.zeros(0, dtype=np.int32)])
+            self.levels.append(None)
+        dtype = np.int32 if self.n_rows < 2**31 else np.int64
+        buffers = self.buffers[level]
+        buffers[0], n = append_rows(buffers[0], first, imin.astype(dtype))
+        buffers[1], n = append_rows(buffers[1], first, imax.astype(dtype))
+        self.levels[level] = (buffers[0][:n], buffers[1][:n])
+
+    def _merge(self, column, indices, better):
+        if indices.shape[0] % 2 == 1:
+            indices = np.append(indices, indices[-1])
+        first = indices[0::2]
+        second = indices[1::2]
+        return np.where(better(column[second], column[first]), second, first)
+
+    def rows(self, start, stop, n_buckets):
+        '''
+        indices of rows to draw instead of rows start:stop
+        so that there are about n_buckets buckets (e.g. pixels)
+        '''
+        n = stop - start
+        if n <= 2*n_buckets or self.levels == []:
+            return np.arange(start, stop)
+        level = int(np.ceil(np.log2(float(n) / (n_buckets*self.base))))
+        level = min(max(level, 0), len(self.levels) - 1)
+        size = self.base*2**level
+        imin, imax = self.levels[level]
+        first = start // size
+        last = (stop - 1) // size + 1
+        rows = np.concatenate([[start, stop - 1], imin[first:last],
+                               imax[first:last]])
+        rows = np.unique(rows)
+        return rows[(rows >= start) & (rows < stop)]
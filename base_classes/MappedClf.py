@@ -0,0 +1,127 @@
+import mmap
+import re
+import numpy as np
+from TCI.base_classes.InputReader import InputReader
+from TCI.base_classes.PropertyTable import PropertyTable
+from TCI.lib.logger import logger
+
+
+class MappedClf:
+    '''
+    Memory-mapped clf file.
+    On opening, the file is scanned once for the header and
+    the offsets of the table rows. The rows are parsed only
+    when they are requested, so opening a large file is cheap.
+    '''
+    scan_block = 64*1024**2     # bytes scanned for newlines at once
+
+    def __init__(self, fname, headerexpr="Time.*Sig1[^\n]+"):
+        self.fname = fname
+        self.reader = InputReader()
+        with open(fname, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        match = re.search(headerexpr.encode(), self.map)
+        if match is None:
+            self.close()
+            raise IOError("No header in %s" % (fname))
+        header = self.map[match.start():match.end()].decode(errors='replace')
+        header = header.rstrip('\r')
+        self.names, self.units = self.reader.parseHeader(header)
+        self.string_columns = self.reader.findStringColumns(header)
+        preamble = self.map[:match.start()].decode(errors='replace')
+        self.properties = PropertyTable(preamble)
+        self.buildIndex(match.end())
+
+    def buildIndex(self, table_start):
+        '''
+        find offsets of the table rows.
+        starts - position of the first character of each row
+        ends - position of the newline character ending the row
+        '''
+        newlines = []
+        size = len(self.map)
+        for block_start in range(table_start, size, self.scan_block):
+            block_end = min(block_start + self.scan_block, size)
+            block = np.frombuffer(self.map[block_start:block_end],
+                                  dtype=np.uint8)
+            newlines.append(np.flatnonzero(block == ord('\n')) + block_start)
+        newlines = np.concatenate(newlines + [np.array([], dtype=int)])
+        # the header line ends with the first newline
+        starts = newlines[:-1] + 1
+        ends = newlines[1:]
+        if newlines.size > 0 and newlines[-1] < size - 1:
+            # last row is not terminated with a newline
+            starts = np.append(starts, newlines[-1] + 1)
+            ends = np.append(ends, size)
+        # skip empty lines ('\n' or '\r\n')
+        not_empty = (ends - starts) > 1
+        self.starts = starts[not_empty]
+        self.ends = ends[not_empty]
+        logger.info('Indexed %d rows in %s' % (self.n_rows(), self.fname))
+
+    def n_rows(self):
+        return self.starts.shape[0]
+
+    def rows(self, start, stop, step=1):
+        '''
+        parse rows start:stop:step of the table
+        Returns values, comments same as InputReader.read_clf
+        '''
+        start, stop, step = slice(start, stop, step).indices(self.n_rows())
+        if step == 1:
+            if stop <= start:
+                return self.takeRows([])
+            text = self.map[self.starts[start]:self.ends[stop - 1]]
+            return self.reader.readUnstructuredTable(
+                text.decode(errors='replace'), self.string_columns)
+        return self.takeRows(np.arange(start, stop, step))
+
+    def takeRows(self, indices):
+        '''
+        parse only the rows with given indices
+        '''
+        lines = [self.map[self.starts[i]:self.ends[i]] for i in indices]
+        text = b'\n'.join(lines).decode(errors='replace')
+        values, comments = self.reader.readUnstructuredTable(
+            text, self.string_columns)
+        if values.shape[0] == 0:
+            n_strings = len(self.string_columns)
+            values = np.zeros([0, len(self.names)])
+            comments = np.zeros([0, n_strings], dtype=bytes)
+        return values, comments
+
+    def value(self, row, key):
+        '''
+        value of column key in a single row
+        '''
+        values, comments = self.takeRows([row])
+        return values[0, self.names.index(key)]
+
+    def findRows(self, key, interval):
+        '''
+        row range [start, stop) where values of the column key
+        lie within interval. The column must be monotonically
+        increasing (like Time), so binary search parses only
+        a few rows
+        '''
+        return (self._bisect(key, interval[0]),
+                self._bisect(key, interval[1], right=True))
+
+    def _bisect(self, key, x, right=False):
+        lo = 0
+        hi = self.n_rows()
+        while lo < hi:
+            mid = (lo + hi)//2
+            value = self.value(mid, key)
+            if value < x or (right and value == x):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def findProperty(self, expr):
+        return self.properties.findProperty(expr)
+
+    def close(self):
+        self.map.close()
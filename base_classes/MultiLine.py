@@ -5,7 +5,9 @@ from PySide import QtCore, QtGui
 
 class MultiLine(pg.QtGui.QGraphicsPathItem):
     def __init__(self, x, y):
-        """x and y are 2D arrays of shape (Nplots, Nsamples)"""
+        """x and y are 2D arrays of shape (Nplots, Nsamples),
+        x can be 1D if all plots have the same x"""
+        if x.ndim == 1: x = np.broadcast_to(x, y.shape)
         connect = np.ones(x.shape, dtype=bool)
         connect[:,-1] = 0 # don't draw the segment between each trace
         self.path = pg.arrayToQPath(x.flatten(), y.flatten(), connect.flatten())
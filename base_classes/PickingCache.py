@@ -0,0 +1,54 @@
+from collections import OrderedDict
+import numpy as np
+
+
+class PickingCache:
+    '''
+    Arrival picking results keyed by wave, picker, its parameters
+    and the table they were picked on (uid and version), so that
+    going back to earlier settings does not pick again.
+    The least recently used results are dropped when there are
+    more than size of them
+    '''
+    def __init__(self, size=32):
+        self.size = size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(wave, picker, params, table, indices=None, transmitter=False):
+        '''
+        params - tuple of hashable parameters of the picker
+        indices - tracks of the table that are picked (all if None)
+        transmitter - whether the result depends on the transmitter
+        times of the table (see SonicTable.setTransmitter)
+        '''
+        if indices is not None:
+            indices = np.asarray(indices, dtype=np.int64).tobytes()
+        version = (table.version,
+                   table.transmitter_version if transmitter else None)
+        return (wave, picker, params, table.uid, version, indices)
+
+    def get(self, key):
+        '''
+        result stored with key or None
+        '''
+        if key not in self.results:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.results.move_to_end(key)
+        return self.results[key]
+
+    def put(self, key, result):
+        self.results[key] = result
+        self.results.move_to_end(key)
+        while len(self.results) > self.size:
+            self.results.popitem(last=False)
+
+    def clear(self):
+        self.results.clear()
+
+    def __len__(self):
+        return len(self.results)
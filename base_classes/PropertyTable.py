@@ -0,0 +1,69 @@
+import re
+from collections import OrderedDict
+
+
+class PropertyTable:
+    '''
+    Properties of a test stored in a clf file before the data
+    table ([Test Parameters], Endcap.* etc.).
+    The text is parsed once into:
+    entries - key=value lines of the text
+    signals - Test Parameters N.Cluster.Signal/Value/Unit triples
+    as signal name -> (value, unit), e.g. 'Length' -> (2.033, 'in')
+    so the text itself does not have to be kept.
+    '''
+    def __init__(self, text=''):
+        self.entries = OrderedDict()
+        self.signals = OrderedDict()
+        self.addEntries(self.parseLines(text))
+
+    def parseLines(self, text):
+        entries = []
+        for line in text.splitlines():
+            key, sep, value = line.partition('=')
+            if sep == '': continue
+            entries.append((key.strip(), value.strip()))
+        return entries
+
+    def addEntries(self, entries):
+        '''
+        entries - list of (key, value) string pairs
+        '''
+        for key, value in entries:
+            self.entries[key] = value
+        for key in self.entries:
+            if not key.endswith('.Cluster.Signal'): continue
+            prefix = key[:-len('Signal')]
+            value = self.entries.get(prefix + 'Value')
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                pass
+            unit = self.entries.get(prefix + 'Unit', '')
+            self.signals[self.entries[key]] = (value, unit)
+
+    def findProperty(self, expr):
+        '''
+        value of the property given by a key or an expression
+        like 'Test Parameters 3.Cluster.Value=' (the rest of
+        the line after expr is returned, as if the text was searched)
+        Returns None if there is no such property
+        '''
+        key = expr.rstrip('=').strip()
+        if key in self.entries:
+            return self.entries[key]
+        for key, value in self.entries.items():
+            line = '%s=%s' % (key, value)
+            match = re.search(expr, line)
+            if match is not None:
+                return line[match.end():]
+        return None
+
+    def value(self, signal):
+        '''
+        numeric value of a Test Parameters signal, e.g. 'Length'
+        '''
+        return self.signals[signal][0]
+
+    def unit(self, signal):
+        return self.signals[signal][1]
@@ -0,0 +1,146 @@
+import struct
+import zipfile
+import numpy as np
+from TCI.base_classes.SonicTable import SonicTable
+from TCI.lib.logger import logger
+
+WAVE_TYPES = ['P', 'Sx', 'Sy']
+EXTENSION = '.sonic.npz'
+
+
+class SonicArchive:
+    '''
+    Sonic traces of an experiment packed in one uncompressed
+    npz file, so they are parsed from the TRC files only once.
+    For every wave type the archive stores:
+    <wave>_names - file names of the traces (rows of the table)
+    <wave>_time - (n_samples,) time axis shared by all traces
+    <wave>_offsets - (n_tracks,) time offsets of the traces
+    <wave>_transmitter - (n_tracks,) transmitter times of the traces
+    (zeros if the archive has none)
+    <wave>_amplitude - (n_tracks, n_samples) amplitude matrix
+    or integer codes of a quantized table with
+    <wave>_scale, <wave>_zero - (n_tracks,) scale and offset of codes
+    <wave>_headers - text of the TRC header of every trace
+    Arrays are memory-mapped when the archive is opened.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.names = {}
+        self.time = {}
+        self.offsets = {}
+        self.transmitter = {}
+        self.amplitude = {}
+        self.scale = {}
+        self.zero = {}
+        self.headers = {}
+
+    def pack(self, names, table, headers=None):
+        '''
+        names - dict wave -> file names of the tracks
+        table - dict wave -> SonicTable
+        (SonicViewer.names and SonicViewer.table)
+        headers - dict wave -> dict file name -> header text
+        '''
+        for wave in WAVE_TYPES:
+            self.names[wave] = list(names[wave])
+            self.time[wave] = np.asarray(table[wave].time)
+            sonic_table = table[wave]
+            # the transmitter shift is stored separately
+            self.offsets[wave] = sonic_table.trackOffsets(transmitter=False)
+            self.transmitter[wave] = sonic_table.transmitterTimes()
+            if sonic_table.scale is None:
+                self.amplitude[wave] = sonic_table.amplitudes()
+                self.scale[wave] = self.zero[wave] = None
+            else:
+                # keep the codes
+                rows = sonic_table.tracks
+                self.amplitude[wave] = np.asarray(sonic_table.amplitude[rows])
+                self.scale[wave] = sonic_table.scale[rows]
+                self.zero[wave] = sonic_table.zero[rows]
+            wave_headers = {} if headers is None else headers[wave]
+            self.headers[wave] = [wave_headers.get(n, '')
+                                  for n in self.names[wave]]
+
+    def save(self):
+        arrays = {}
+        for wave in WAVE_TYPES:
+            arrays[wave + '_names'] = np.array(self.names[wave], dtype=str)
+            arrays[wave + '_time'] = self.time[wave]
+            arrays[wave + '_offsets'] = self.offsets[wave]
+            arrays[wave + '_transmitter'] = self.transmitter[wave]
+            arrays[wave + '_amplitude'] = self.amplitude[wave]
+            if self.scale[wave] is not None:
+                arrays[wave + '_scale'] = self.scale[wave]
+                arrays[wave + '_zero'] = self.zero[wave]
+            arrays[wave + '_headers'] = np.array(self.headers[wave],
+                                                 dtype=str)
+        np.savez(self.filename, **arrays)
+        logger.info('Saved sonic archive %s' % (self.filename))
+
+    def open(self):
+        '''
+        read names and headers and memory-map the time axes
+        and amplitudes. Raises IOError if the file is not an archive
+        '''
+        try:
+            with np.load(self.filename) as archive:
+                for wave in WAVE_TYPES:
+                    self.names[wave] = [str(n) for n in
+                                        archive[wave + '_names']]
+                    self.headers[wave] = [str(h) for h in
+                                          archive[wave + '_headers']]
+                    self.offsets[wave] = None
+                    if wave + '_offsets' in archive.files:
+                        self.offsets[wave] = archive[wave + '_offsets']
+                    self.transmitter[wave] = None
+                    if wave + '_transmitter' in archive.files:
+                        self.transmitter[wave] = \
+                            archive[wave + '_transmitter']
+                    self.scale[wave] = self.zero[wave] = None
+                    if wave + '_scale' in archive.files:
+                        self.scale[wave] = archive[wave + '_scale']
+                        self.zero[wave] = archive[wave + '_zero']
+            for wave in WAVE_TYPES:
+                self.time[wave] = self.mapMember(wave + '_time')
+                self.amplitude[wave] = self.mapMember(wave + '_amplitude')
+        except (KeyError, ValueError, zipfile.BadZipfile) as e:
+            raise IOError('%s is not a sonic archive: %s' %
+                          (self.filename, e))
+        logger.info('Opened sonic archive %s' % (self.filename))
+
+    def mapMember(self, name):
+        '''
+        memory-map an array stored in the (uncompressed) npz file
+        '''
+        with open(self.filename, 'rb') as f:
+            with zipfile.ZipFile(f) as archive:
+                info = archive.getinfo(name + '.npy')
+            if info.compress_type != zipfile.ZIP_STORED:
+                with np.load(self.filename) as archive:
+                    return archive[name]
+            # skip the local header of the member
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            shape, fortran_order, dtype = header
+            offset = f.tell()
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        order = 'F' if fortran_order else 'C'
+        return np.memmap(self.filename, dtype=dtype, mode='r',
+                         offset=offset, shape=shape, order=order)
+
+    def table(self, wave):
+        '''
+        SonicTable reading tracks from the archive
+        '''
+        return SonicTable(self.time[wave], self.amplitude[wave],
+                          self.offsets[wave], scale=self.scale[wave],
+                          zero=self.zero[wave],
+                          transmitter=self.transmitter[wave])
@@ -0,0 +1,272 @@
+import tempfile
+import itertools
+import numpy as np
+from TCI.lib.functions import natural_keys, resample_tracks, quantize
+from TCI.lib.logger import logger
+
+
+class SonicTable:
+    '''
+    Sonic tracks of one wave type kept in memory-mapped arrays,
+    so that only the tracks that are plotted, picked or
+    transformed are read into memory.
+    time - (n_samples,) time axis shared by all tracks
+    amplitude - (n_tracks, n_samples) amplitudes or integer codes
+    scale, zero - (n_tracks,) if amplitude holds codes:
+    amplitude of the track k is scale[k]*codes + zero[k]
+    offsets - (n_tracks,) time of the track k is time - offsets[k]
+    (e.g. transmitter shift)
+    tracks - rows of the arrays that belong to the table
+    (removing tracks does not copy the arrays)
+    transmitter - (n_tracks,) time of the transmitter pulse of the
+    tracks, subtracted from their time as a separate stage
+    uid, version - identify the table and its data for caching results
+    computed from it, transmitter_version changes with the transmitter
+    '''
+    chunk_size = 1000   # tracks quantized at once
+    uids = itertools.count()
+
+    def __init__(self, time, amplitude, offsets=None, tracks=None,
+                 scale=None, zero=None, transmitter=None):
+        if time.ndim == 2:
+            time, offsets = self.splitTime(time)
+        self.time = time
+        self.amplitude = amplitude
+        if offsets is None:
+            offsets = np.zeros(amplitude.shape[0])
+        self.offsets = np.array(offsets, dtype=float)
+        if tracks is None:
+            tracks = np.arange(amplitude.shape[0])
+        self.tracks = tracks
+        self.scale = scale
+        self.zero = zero
+        if transmitter is None:
+            transmitter = np.zeros(amplitude.shape[0])
+        self.transmitter = np.array(transmitter, dtype=float)
+        self.uid = next(self.uids)
+        self.version = 0
+        self.transmitter_version = 0
+
+    @classmethod
+    def fromDict(cls, dictionary):
+        '''
+        dictionary - file name -> (n_samples, 2) array of
+        time and amplitude (as returned by read_TRC).
+        Tracks are sorted by names in natural order, amplitudes
+        are written to an anonymous temporary file.
+        The grid of the table is the sampling of the most common
+        track length. Tracks with other length or dt are resampled
+        onto it, tracks that are not sampled uniformly or cover
+        less than half of it are dropped. Names of the tracks in the
+        table, resampled and dropped tracks are stored in
+        names, resampled and dropped
+        '''
+        names = sorted(dictionary.keys(), key=natural_keys)
+        lengths = np.array([dictionary[n].shape[0] for n in names],
+                           dtype=int)
+        # group tracks of the same length and check their sampling
+        # (only the time columns are copied, chunk by chunk)
+        groups = []
+        for length in np.unique(lengths):
+            group = np.flatnonzero(lengths == length)
+            tracks = [dictionary[names[k]] for k in group]
+            groups.append((group, length) + cls.trackSampling(tracks))
+
+        # most common length of uniformly sampled tracks
+        counts = [(g[3].sum(), g[1]) for g in groups]
+        if counts == [] or max(counts)[0] == 0:
+            result = cls(np.zeros(0), np.zeros((0, 0)))
+            result.names, result.resampled = [], []
+            result.dropped = names
+            cls.report(result)
+            return result
+        group, n_samples, step, uniform, first = \
+            groups[counts.index(max(counts))]
+        reference = np.flatnonzero(uniform)[0]
+        grid_step = step[reference]
+        grid = np.array(dictionary[names[group[reference]]][:, 0])
+        start, duration = grid[0], grid[-1] - grid[0]
+
+        same = np.zeros(len(names), dtype=bool)
+        resampled = np.zeros(len(names), dtype=bool)
+        offsets = np.zeros(len(names))
+        for group, length, step, uniform, first in groups:
+            same[group] = uniform & (length == n_samples) & \
+                (np.abs(step - grid_step) <= 1e-6*grid_step)
+            covers = uniform & (step*(length - 1) >= 0.5*duration)
+            resampled[group] = covers & ~same[group]
+            offsets[group] = start - first
+        keep = same | resampled
+        rows = np.flatnonzero(keep)
+        # row of every kept track in the table
+        position = np.cumsum(keep) - 1
+
+        # tracks are written to the file row by row, so the whole
+        # table is never in memory
+        storage = tempfile.TemporaryFile()
+        table = np.memmap(storage, dtype=np.float64, mode='w+',
+                          shape=(rows.shape[0], n_samples))
+        for k in np.flatnonzero(same):
+            table[position[k]] = dictionary[names[k]][:, 1]
+        for group, length, step, uniform, first in groups:
+            other = group[resampled[group]]
+            for i in range(0, other.shape[0], cls.chunk_size):
+                chunk = other[i:i + cls.chunk_size]
+                tracks = np.array([dictionary[names[k]] for k in chunk])
+                table[position[chunk]] = resample_tracks(
+                    tracks[:, :, 0], tracks[:, :, 1], grid_step, n_samples)
+
+        result = cls(grid, table, offsets[rows])
+        # the file is deleted when it is closed
+        result.storage = storage
+        result.names = [names[k] for k in rows]
+        result.resampled = [names[k] for k in np.flatnonzero(resampled)]
+        result.dropped = [names[k] for k in np.flatnonzero(~keep)]
+        cls.report(result)
+        return result
+
+    @classmethod
+    def trackSampling(cls, tracks):
+        '''
+        dt, whether they are sampled uniformly and start times
+        of tracks of the same length ((n_samples, 2) arrays),
+        checked chunk_size tracks at a time
+        '''
+        steps, uniform = [], []
+        for i in range(0, len(tracks), cls.chunk_size):
+            time = np.array([t[:, 0] for t in tracks[i:i + cls.chunk_size]])
+            chunk_steps, chunk_uniform = cls.sampling(time)
+            steps.append(chunk_steps)
+            uniform.append(chunk_uniform)
+        first = np.array([t[0, 0] if t.shape[0] > 0 else 0. for t in tracks])
+        return np.concatenate(steps), np.concatenate(uniform), first
+
+    @staticmethod
+    def sampling(time):
+        '''
+        dt of tracks (rows of time) and whether they are sampled
+        uniformly
+        '''
+        n_points = time.shape[1]
+        if n_points < 2:
+            return (np.zeros(time.shape[0]),
+                    np.zeros(time.shape[0], dtype=bool))
+        step = (time[:, -1] - time[:, 0]) / (n_points - 1)
+        error = np.abs(np.diff(time, axis=1) - step[:, np.newaxis])
+        error = error.max(axis=1)
+        return step, (step > 0) & (error <= 1e-3*step)
+
+    @staticmethod
+    def report(table):
+        if table.resampled != []:
+            logger.warning('Resampled %d tracks with other dt or length: %s'
+                           % (len(table.resampled),
+                              ', '.join(table.resampled)))
+        if table.dropped != []:
+            logger.warning('Dropped %d irregular or short tracks: %s'
+                           % (len(table.dropped), ', '.join(table.dropped)))
+
+    def splitTime(self, time):
+        '''
+        time axis of the first track and offsets of all tracks
+        from a (n_tracks, n_samples) time matrix
+        '''
+        if time.shape[0] == 0:
+            return np.zeros(time.shape[1]), None
+        offsets = time[0, 0] - time[:, 0]
+        return np.array(time[0]), offsets
+
+    def __len__(self):
+        return self.tracks.shape[0]
+
+    def nSamples(self):
+        return self.amplitude.shape[1]
+
+    def amplitudes(self, indices=None):
+        '''
+        (n_indices, n_samples) amplitudes of the tracks
+        with the given indices (all tracks if None)
+        '''
+        rows = self.tracks if indices is None else self.tracks[indices]
+        if self.scale is None:
+            return np.asarray(self.amplitude[rows])
+        # dequantize only the requested tracks
+        return (self.amplitude[rows]*self.scale[rows, np.newaxis] +
+                self.zero[rows, np.newaxis])
+
+    def quantize(self, bits=8):
+        '''
+        store amplitudes as int8 (bits <= 8) or int16 codes with
+        a scale and an offset per track (see lib.functions.quantize)
+        '''
+        if self.scale is not None or self.amplitude.size == 0: return
+        dtype = np.int8 if bits <= 8 else np.int16
+        storage = tempfile.TemporaryFile()
+        codes = np.memmap(storage, dtype=dtype, mode='w+',
+                          shape=self.amplitude.shape)
+        n_tracks = self.amplitude.shape[0]
+        scale = np.ones(n_tracks)
+        zero = np.zeros(n_tracks)
+        for start in range(0, n_tracks, self.chunk_size):
+            stop = start + self.chunk_size
+            codes[start:stop], scale[start:stop], zero[start:stop] = \
+                quantize(np.asarray(self.amplitude[start:stop]), dtype)
+        self.amplitude = codes
+        self.scale, self.zero = scale, zero
+        self.version += 1
+        # the old file is deleted when it is not referenced anymore
+        self.storage = storage
+
+    def trackOffsets(self, indices=None, transmitter=True):
+        rows = self.tracks if indices is None else self.tracks[indices]
+        if not transmitter:
+            return self.offsets[rows]
+        return self.offsets[rows] + self.transmitter[rows]
+
+    def transmitterTimes(self, indices=None):
+        rows = self.tracks if indices is None else self.tracks[indices]
+        return self.transmitter[rows]
+
+    def setTransmitter(self, times, indices=None):
+        '''
+        set the time of the transmitter pulse (scalar or one per
+        track), so that it is at zero. The previous value is replaced,
+        so setting it again with the same times changes nothing
+        '''
+        rows = self.tracks if indices is None else self.tracks[indices]
+        transmitter = self.transmitter.copy()
+        transmitter[rows] = times
+        if not np.array_equal(transmitter, self.transmitter):
+            self.transmitter = transmitter
+            self.transmitter_version += 1
+
+    def times(self, indices=None, transmitter=True):
+        '''
+        time of the tracks with the given indices:
+        (n_samples,) axis if they have the same offset,
+        otherwise (n_indices, n_samples).
+        transmitter - whether the transmitter time is subtracted
+        '''
+        offsets = self.trackOffsets(indices, transmitter)
+        if offsets.shape[0] == 0 or (offsets == offsets[0]).all():
+            offset = offsets[0] if offsets.shape[0] > 0 else 0.
+            return self.time - offset
+        return self.time - offsets[:, np.newaxis]
+
+    def shift(self, shift, indices=None):
+        '''
+        subtract shift (scalar or one per track) from the time
+        of the tracks
+        '''
+        rows = self.tracks if indices is None else self.tracks[indices]
+        self.offsets[rows] += shift
+        self.version += 1
+
+    def removeTracks(self, indices):
+        '''
+        remove tracks with the given indices from the table
+        '''
+        keep = np.ones(len(self), dtype=bool)
+        keep[indices] = False
+        self.tracks = self.tracks[keep]
+        self.version += 1
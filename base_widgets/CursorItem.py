@@ -15,6 +15,7 @@ class CursorItem(EllipseROI):
         self.aspectLocked = True
         self.hasData = False
         self.index = None
+        self.rows = None
         self.currentPen = pg.mkPen(color=(255,0,255),width=2.5)
         self.setPen(self.currentPen)
 
@@ -23,9 +24,14 @@ class CursorItem(EllipseROI):
         if self.translatable and self.isMoving and ev.buttons() == QtCore.Qt.LeftButton:
             if self.hasData: self.moveToNearest()
 
-    def setData(self,xarray,yarray):
+    def setData(self,xarray,yarray,rows=None):
+        '''
+        rows - rows of the data set of the points, so that
+        self.index is a row of the data set (not of the arrays)
+        '''
         self.xarray = xarray
         self.yarray = yarray
+        self.rows = rows
         self.hasData = True
         self.moveToNearest()
 
@@ -35,8 +41,10 @@ class CursorItem(EllipseROI):
         '''
         # index of the nearest x data point
         # print self.index
-        self.index = (np.abs(self.xarray-self.position()[0])).argmin()
-        newPos = Point(self.xarray[self.index],self.yarray[self.index])
+        point = (np.abs(self.xarray-self.position()[0])).argmin()
+        self.index = point
+        if self.rows is not None: self.index = self.rows[point]
+        newPos = Point(self.xarray[point],self.yarray[point])
         self.translate(newPos - self.pos() - self.size()/2, snap=None, finish=False)
 
     def position(self):
@@ -1,24 +1,19 @@
 import numpy as np
 
 def get_fft(x, y):
+    '''
+    x - time axis (n_samples,) or time of every track
+    y - (n_tracks, n_samples) amplitudes
+    returns pairs of frequency axis and
+    transform (all frequencies), amplitude and phase (positive ones)
+    '''
+    x = np.atleast_2d(x)[0]
     N = y.shape[1]
-    h = x[0,1] - x[0,0]
-    # yf = np.fft.fft(y).real[:,:N/2]
+    h = x[1] - x[0]
     ft = np.fft.fft(y)
     fft = ft[:, :int(N/2)]
-    fft = np.fft.fft(y)[:, :int(N/2)]
     yf = np.absolute(fft)
     yp = np.arctan2(fft.imag,fft.real)
     xf0 = np.fft.fftfreq(N,h)
     xf = xf0[:int(N/2)]
-    xf = np.tile(xf,y.shape[0])
-    xf0 = np.tile(xf0,y.shape[0])
-    xf = xf.reshape(yf.shape[0],yf.shape[1])
-    xf0 = xf0.reshape(ft.shape[0],ft.shape[1])
-    # array to store fft + frequences
-    fft = np.array((xf0,ft))
-    # array to store fft amplitude + frequences
-    fft_amp = np.array((xf,yf))
-    # array to store fft phase + frequences
-    fft_phase = np.array((xf,yp))
-    return fft, fft_amp, fft_phase
+    return (xf0, ft), (xf, yf), (xf, yp)
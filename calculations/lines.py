@@ -0,0 +1,112 @@
+import numpy as np
+from TCI.calculations.pickers import cumulative, window_sums, track_sampling
+
+
+def edge_map(amplitude, window=20):
+    '''
+    growth of the energy along time: log ratio of the mean energy
+    in window samples after and before every sample, scaled to
+    the maximum of every track. Arrival and transmitter fronts,
+    where the energy rises above the noise, are the ridges of the map
+    '''
+    energy = amplitude - np.median(amplitude, axis=1)[:, np.newaxis]
+    energy *= energy
+    csum = cumulative(energy)
+    k = np.arange(amplitude.shape[1])
+    after = window_sums(csum, k, k + window)[0]
+    before = window_sums(csum, k - window, k)[0]
+    # keeps the ratio finite on flat parts of the tracks
+    floor = 1e-3*energy.mean(axis=1)[:, np.newaxis]*window + \
+        np.finfo(float).tiny
+    edges = np.log((after + floor)/(before + floor))
+    # windows cut at the ends of the tracks
+    edges[:, (k < window) | (k > amplitude.shape[1] - window)] = 0
+    largest = np.abs(edges).max(axis=1)[:, np.newaxis]
+    largest[largest == 0] = 1
+    return edges/largest
+
+def edge_points(edges, threshold=0.5):
+    '''
+    tracks, samples and strength of the ridge points:
+    local maxima along time that are above threshold
+    '''
+    ridge = np.zeros(edges.shape, dtype=bool)
+    ridge[:, 1:-1] = ((edges[:, 1:-1] >= edges[:, :-2]) &
+                      (edges[:, 1:-1] > edges[:, 2:]) &
+                      (edges[:, 1:-1] >= threshold))
+    tracks, samples = np.nonzero(ridge)
+    return tracks, samples, edges[tracks, samples]
+
+def hough_fronts(edges, n_lines=5, max_slope=2., n_slopes=81,
+                 threshold=0.5, suppress=50, n_candidates=10000):
+    '''
+    straight fronts sample = intercept + slope*track through the
+    ridge points of an edge map, found with a Hough transform:
+    every point votes with its strength for the lines through it,
+    which are accumulated for all points and slopes at once.
+    max_slope - largest slope (samples per track)
+    suppress - lines closer than that (mean distance in samples)
+    to a stronger one are skipped, n_candidates strongest lines are checked
+    returns (n, 2) array of intercepts and slopes, (n,) votes
+    '''
+    n_tracks, n_samples = edges.shape
+    tracks, samples, strength = edge_points(edges, threshold)
+    slopes = np.linspace(-max_slope, max_slope, n_slopes)
+    # intercepts of the lines through every point
+    margin = int(np.ceil(max_slope*n_tracks))
+    intercepts = np.round(samples[:, np.newaxis] -
+                          tracks[:, np.newaxis]*slopes).astype(int) + margin
+    n_bins = n_samples + 2*margin
+    bins = intercepts + np.arange(n_slopes)*n_bins
+    votes = np.bincount(bins.ravel(), np.repeat(strength, n_slopes),
+                        minlength=n_slopes*n_bins)
+    votes = votes.reshape(n_slopes, n_bins)
+    # strongest lines, the ones near them are skipped
+    order = np.argsort(votes.ravel())[::-1]
+    tracks_axis = np.arange(n_tracks)
+    lines = []
+    scores = []
+    for peak in order[:n_candidates]:
+        if len(lines) == n_lines or votes.flat[peak] <= 0: break
+        slope, intercept = np.unravel_index(peak, votes.shape)
+        line = (intercept - margin, slopes[slope])
+        # mean distance of the lines over the tracks
+        if any(np.abs(line[0] - l[0] + (line[1] - l[1])*tracks_axis).mean()
+               < suppress for l in lines): continue
+        lines.append(line)
+        scores.append(votes.flat[peak])
+    return np.array(lines).reshape(-1, 2), np.array(scores)
+
+def follow_front(edges, line, tolerance=10):
+    '''
+    samples of a front on every track: the strongest edge within
+    tolerance samples of the line, so the front may bend
+    line - (intercept, slope) from hough_fronts
+    '''
+    n_tracks, n_samples = edges.shape
+    center = np.round(line[0] + line[1]*np.arange(n_tracks)).astype(int)
+    offsets = np.arange(-tolerance, tolerance + 1)
+    band = np.clip(center[:, np.newaxis] + offsets, 0, n_samples - 1)
+    rows = np.arange(n_tracks)[:, np.newaxis]
+    best = edges[rows, band].argmax(axis=1)
+    return band[np.arange(n_tracks), best]
+
+def detect_fronts(time, amplitude, n_lines=5, window=20, **params):
+    '''
+    candidate arrival and transmitter fronts of a set of tracks
+    time - (n_samples,) axis or (n_tracks, n_samples) time of every track
+    params - passed to hough_fronts
+    returns edge map, (n, 2) lines and their arrival times
+    (n, n_tracks) on every track
+    '''
+    edges = edge_map(amplitude, window)
+    lines = hough_fronts(edges, n_lines, **params)[0]
+    arrivals = np.array([front_times(time, edges, line) for line in lines])
+    return edges, lines, arrivals.reshape(-1, amplitude.shape[0])
+
+def front_times(time, edges, line, tolerance=10):
+    '''
+    arrival times of a front on every track (see follow_front)
+    '''
+    start, step = track_sampling(time, edges.shape[0])
+    return start + follow_front(edges, line, tolerance)*step
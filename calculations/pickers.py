@@ -0,0 +1,214 @@
+import numpy as np
+
+
+def window_sums(csum, start, stop):
+    '''
+    sums of windows [start, stop) of every row from cumulative
+    sums csum (n_tracks, n_samples+1) with zero first column.
+    start, stop - (n,) column indices clipped to the rows
+    '''
+    n_samples = csum.shape[1] - 1
+    start = np.clip(start, 0, n_samples)
+    stop = np.clip(stop, 0, n_samples)
+    return csum[:, stop] - csum[:, start], stop - start
+
+def cumulative(x):
+    csum = np.zeros((x.shape[0], x.shape[1] + 1))
+    np.cumsum(x, axis=1, out=csum[:, 1:])
+    return csum
+
+def aic(amplitude):
+    '''
+    Akaike information criterion of splitting every track at
+    sample k into noise and signal (Maeda's variant):
+    AIC(k) = k*log(var(x[:k])) + (n-k-1)*log(var(x[k+1:n]))
+    n is the sample of the maximum amplitude of the track, so that
+    the coda after it does not shift the minimum (the arrival)
+    '''
+    x = amplitude - amplitude.mean(axis=1)[:, np.newaxis]
+    s1 = cumulative(x)
+    s2 = cumulative(x*x)
+    k = np.arange(amplitude.shape[1])
+    end = np.abs(x).argmax(axis=1)[:, np.newaxis] + 1
+    n_before = k.astype(float)
+    n_after = (end - k - 1).astype(float)
+    s1_end = np.take_along_axis(s1, end, axis=1)
+    s2_end = np.take_along_axis(s2, end, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var_before = s2[:, k]/n_before - (s1[:, k]/n_before)**2
+        var_after = ((s2_end - s2[:, k+1])/n_after -
+                     ((s1_end - s1[:, k+1])/n_after)**2)
+        tiny = np.finfo(float).tiny
+        result = (n_before*np.log(np.maximum(var_before, tiny)) +
+                  n_after*np.log(np.maximum(var_after, tiny)))
+    # variances of less than 2 samples are not defined
+    result[(k < 2) | (n_after < 2)] = np.nan
+    return result
+
+def sta_lta(amplitude, sta=20, lta=200):
+    '''
+    ratio of the short term average of the energy after sample k
+    (sta samples) and the long term average before it (lta samples).
+    The arrival is the first sample where it exceeds a threshold
+    '''
+    energy = amplitude - np.median(amplitude, axis=1)[:, np.newaxis]
+    energy *= energy
+    csum = cumulative(energy)
+    k = np.arange(amplitude.shape[1])
+    short, n_short = window_sums(csum, k, k + sta)
+    before, n_before = window_sums(csum, k - lta, k)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = (short/n_short)/(before/n_before)
+    # the long window has to be full
+    result[:, k < lta] = np.nan
+    return result
+
+def energy_ratio(amplitude, window=50):
+    '''
+    ratio of the energy in window samples after and before sample k.
+    The arrival is the maximum
+    '''
+    energy = amplitude - np.median(amplitude, axis=1)[:, np.newaxis]
+    energy *= energy
+    csum = cumulative(energy)
+    k = np.arange(amplitude.shape[1])
+    after = window_sums(csum, k, k + window)[0]
+    before = window_sums(csum, k - window, k)[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = after/before
+    result[:, (k < window) | (k > amplitude.shape[1] - window)] = np.nan
+    return result
+
+# name -> characteristic function, how the arrival is found in it
+PICKERS = {
+    'AIC': (aic, 'min'),
+    'STA/LTA': (sta_lta, 'threshold'),
+    'Energy ratio': (energy_ratio, 'max'),
+}
+
+def interval_columns(time, shape, interval=None):
+    '''
+    time of every sample, mask of the samples in the time interval
+    and slice of the columns that have any of them (None if none)
+    '''
+    time = np.broadcast_to(time, shape)
+    inside = np.ones(shape, dtype=bool)
+    if interval is not None:
+        inside = (time >= min(interval)) & (time <= max(interval))
+    columns = np.flatnonzero(inside.any(axis=0))
+    if columns.shape[0] == 0: return time, inside, None
+    return time, inside, slice(columns[0], columns[-1] + 1)
+
+def pick_arrivals(time, amplitude, method='AIC', interval=None,
+                  threshold=3., **params):
+    '''
+    arrival times of all tracks at once
+    time - (n_samples,) axis or (n_tracks, n_samples) time of every track
+    amplitude - (n_tracks, n_samples)
+    method - name of the picker in PICKERS
+    interval - (start, stop) time to search for the arrivals in
+    (e.g. to skip the transmitter pulse)
+    threshold - STA/LTA ratio of the arrival
+    params - window lengths (samples) passed to the picker
+    returns (n_tracks,) arrival times, nan if nothing was picked
+    '''
+    function, rule = PICKERS[method]
+    time, inside, columns = interval_columns(time, amplitude.shape, interval)
+    arrivals = np.empty(amplitude.shape[0])
+    arrivals[:] = np.nan
+    if columns is None: return arrivals
+    # compute only on the columns in the interval
+    value = function(amplitude[:, columns], **params)
+    inside = inside[:, columns] & ~np.isnan(value)
+    if rule == 'min':
+        value[~inside] = np.inf
+        index = value.argmin(axis=1)
+    elif rule == 'max':
+        value[~inside] = -np.inf
+        index = value.argmax(axis=1)
+    else:
+        inside &= value >= threshold
+        index = inside.argmax(axis=1)
+    rows = np.flatnonzero(inside.any(axis=1))
+    arrivals[rows] = time[:, columns][rows, index[rows]]
+    return arrivals
+
+def correlation_lags(reference, amplitude, max_lag=None):
+    '''
+    lags (samples) of the rows of amplitude relative to the rows of
+    reference (amplitude[t] ~ reference[t - lag]) from the peak
+    of their cross-correlation, computed with FFT for all rows at once.
+    The peak is interpolated with a parabola for sub-sample lags
+    max_lag - largest lag searched (all by default)
+    '''
+    n_samples = amplitude.shape[1]
+    if max_lag is None: max_lag = n_samples - 1
+    max_lag = int(min(max_lag, n_samples - 1))
+    # zero padding so that the correlation is not circular
+    n_fft = 2**int(np.ceil(np.log2(2*n_samples)))
+    spectrum = np.conj(np.fft.rfft(reference, n_fft)) * \
+        np.fft.rfft(amplitude, n_fft)
+    correlation = np.fft.irfft(spectrum, n_fft)
+    # lags -max_lag..max_lag
+    correlation = np.concatenate([correlation[:, n_fft-max_lag:],
+                                  correlation[:, :max_lag+1]], axis=1)
+    peak = correlation.argmax(axis=1)
+    rows = np.arange(correlation.shape[0])
+    inner = np.clip(peak, 1, correlation.shape[1] - 2)
+    y0 = correlation[rows, inner - 1]
+    y1 = correlation[rows, inner]
+    y2 = correlation[rows, inner + 1]
+    curvature = y0 - 2*y1 + y2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(curvature < 0, 0.5*(y0 - y2)/curvature, 0.)
+    shift[peak != inner] = 0
+    return peak + shift - max_lag
+
+def consecutive_delays(time, amplitude, interval=None, max_lag=None):
+    '''
+    delays (samples) of all tracks relative to the first one,
+    summed from the lags between consecutive tracks, which change
+    little along a loading ramp.
+    interval - (start, stop) time of the window that is correlated
+    (e.g. the first arrival without the transmitter pulse)
+    '''
+    delays = np.zeros(amplitude.shape[0])
+    columns = interval_columns(time, amplitude.shape, interval)[2]
+    if columns is None or amplitude.shape[0] < 2: return delays
+    window = amplitude[:, columns]
+    window = window - window.mean(axis=1)[:, np.newaxis]
+    lags = correlation_lags(window[:-1], window[1:], max_lag)
+    delays[1:] = np.cumsum(lags)
+    return delays
+
+def track_sampling(time, n_tracks):
+    '''
+    (n_tracks,) start times and steps of the tracks
+    '''
+    time = np.broadcast_to(time, (n_tracks, np.shape(time)[-1]))
+    return time[:, 0], time[:, 1] - time[:, 0]
+
+def anchor_delays(time, delays, anchors, picks):
+    '''
+    arrival times of all tracks from their delays (samples)
+    and arrivals picked on a few anchor tracks.
+    The difference between the picks and the delays is interpolated
+    between the anchors, which removes the drift of summed lags.
+    time - (n_samples,) axis or (n_tracks, n_samples) time of every track
+    anchors - indices of the picked tracks, picks - their arrival times
+    '''
+    start, step = track_sampling(time, delays.shape[0])
+    anchors = np.asarray(anchors)
+    picks = np.asarray(picks, dtype=float)
+    picked = ~np.isnan(picks)
+    arrivals = np.empty(delays.shape[0])
+    arrivals[:] = np.nan
+    if not picked.any(): return arrivals
+    anchors, picks = anchors[picked], picks[picked]
+    order = np.argsort(anchors)
+    anchors, picks = anchors[order], picks[order]
+    # picked sample of the anchors minus their delays
+    corrections = (picks - start[anchors])/step[anchors] - delays[anchors]
+    tracks = np.arange(delays.shape[0])
+    samples = delays + np.interp(tracks, anchors, corrections)
+    return start + samples*step
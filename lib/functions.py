@@ -1,6 +1,5 @@
 import re
 import numpy as np
-from scipy.stats.mstats import mode
 # from numba import jit # for optimization
 
 # @jit 
@@ -45,28 +44,131 @@ def get_table(dictionary):
     (1) string keys
     (2) each entries is a nparray (Nx2) 1 - time,2 - amplitude
     Output:
-    3D numpy array. 1st dimension - time or amplitude
-    2nd dimension - number of file
-    3rd dimension - datapoints
+    time - 1D array, time of the first file (shared by all files)
+    amplitude - 2D array. 1st dimension - number of file
+    2nd dimension - datapoints
     '''
     assert type(dictionary) == dict, "wrong input type"
-    # get length of arrays (must be the same)
-    n_points = list(dictionary.values())[0].shape[0]
     # get # of arrays
     names = list(dictionary.keys())
     names.sort(key=natural_keys)
     n_files = len(names)
+    # get length of arrays (must be the same)
+    time = dictionary[names[0]][:, 0].copy()
+    n_points = time.shape[0]
     # allocate space
-    x = np.zeros((n_files, n_points))
     y = np.zeros((n_files, n_points))
     # loop over files
     for k in range(n_files): # use for cause needs to be sorted
-        x[k] = dictionary[names[k]][:, 0]
-        y[k] = dictionary[names[k]][:, 1] 
-    # Create table
-    table = np.array((x, y))
-    # print table
-    return table
+        y[k] = dictionary[names[k]][:, 1]
+    return time, y
+
+def append_rows(buffer, n_rows, rows):
+    '''
+    appends rows to the first n_rows rows of a preallocated
+    buffer. When the buffer is full, it is reallocated twice as
+    large, so appending takes O(len(rows)) time on average.
+    Returns buffer and the new number of rows in it
+    '''
+    n_new = n_rows + rows.shape[0]
+    dtype = np.promote_types(buffer.dtype, rows.dtype)
+    if n_new > buffer.shape[0] or dtype != buffer.dtype:
+        new_shape = (max(2*n_new, 16),) + buffer.shape[1:]
+        new_buffer = np.empty(new_shape, dtype=dtype)
+        new_buffer[:n_rows] = buffer[:n_rows]
+        buffer = new_buffer
+    buffer[n_rows:n_new] = rows
+    return buffer, n_new
+
+def decimate(columns, n_points, keep=None):
+    '''
+    rows to keep so that at most n_points rows (plus the rows
+    in keep) are left. Rows are split into equal buckets, in every
+    bucket the first row and the rows with minimum and maximum
+    of each column are kept, so peaks are not lost.
+    columns - list of 1d arrays of the same length
+    keep - boolean mask of rows that are kept anyway
+    Returns boolean mask of rows
+    '''
+    n_rows = columns[0].shape[0]
+    n_buckets = max(n_points // 2, 1)
+    while True:
+        bucket = -(-n_rows // n_buckets)    # ceil
+        mask = bucket_extrema(columns, bucket)
+        if mask.sum() <= n_points or n_buckets == 1: break
+        n_buckets //= 2
+    if keep is not None:
+        mask |= keep
+    return mask
+
+def bucket_extrema(columns, bucket):
+    '''
+    boolean mask of the first row of every bucket of rows
+    and the rows with extreme values of columns in it
+    '''
+    n_rows = columns[0].shape[0]
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[::bucket] = True
+    mask[-1:] = True
+    n_full = n_rows // bucket
+    offsets = np.arange(n_full)*bucket
+    for column in columns:
+        body = column[:n_full*bucket].reshape(n_full, bucket)
+        mask[offsets + body.argmin(axis=1)] = True
+        mask[offsets + body.argmax(axis=1)] = True
+        tail = column[n_full*bucket:]
+        if tail.shape[0] > 0:
+            mask[n_full*bucket + tail.argmin()] = True
+            mask[n_full*bucket + tail.argmax()] = True
+    return mask
+
+def resample_tracks(time, amplitude, step, n_samples):
+    '''
+    linear interpolation of tracks onto n_samples points
+    spaced by step from the start of every track.
+    time, amplitude - (n_tracks, n_points) arrays of tracks
+    sampled uniformly (dt can be different in each track)
+    Points after the end of a track get its last value.
+    Returns (n_tracks, n_samples) array
+    '''
+    n_tracks, n_points = time.shape
+    dt = (time[:, -1] - time[:, 0]) / (n_points - 1)
+    # fractional index of every new point in its track
+    position = np.arange(n_samples)*step / dt[:, np.newaxis]
+    position = np.clip(position, 0, n_points - 1)
+    index = np.minimum(position.astype(int), n_points - 2)
+    weight = position - index
+    rows = np.arange(n_tracks)[:, np.newaxis]
+    return (amplitude[rows, index]*(1 - weight) +
+            amplitude[rows, index + 1]*weight)
+
+def quantize(amplitude, dtype=np.int8):
+    '''
+    integer codes of tracks (rows of amplitude) with a scale and
+    an offset per track: amplitude = scale*code + zero.
+    If the values of a track are multiples of a step (digitizer
+    levels) and fit into dtype, the step is the scale and the
+    codes are exact, otherwise the range of the track is split
+    into all levels of dtype.
+    Returns codes, scale, zero
+    '''
+    info = np.iinfo(dtype)
+    n_levels = float(info.max) - info.min
+    low = amplitude.min(axis=1)
+    high = amplitude.max(axis=1)
+    # smallest difference of values = digitizer step
+    steps = np.diff(np.sort(amplitude, axis=1), axis=1)
+    steps[steps <= 1e-12*np.abs(high - low)[:, np.newaxis]] = np.inf
+    step = steps.min(axis=1) if steps.shape[1] > 0 else high - low
+    levels = (amplitude - low[:, np.newaxis]) / step[:, np.newaxis]
+    exact = (np.isfinite(step) & ((high - low) / step <= n_levels) &
+             (np.abs(levels - np.round(levels)).max(axis=1) < 1e-3))
+    scale = np.where(exact, step, (high - low) / n_levels)
+    scale[~(scale > 0)] = 1.
+    zero = low - info.min*scale
+    codes = np.round((amplitude - zero[:, np.newaxis]) / scale[:, np.newaxis])
+    codes = np.clip(codes, info.min, info.max).astype(dtype)
+    return codes, scale, zero
 
 # No jit doesn't work for some reason
 # @jit
@@ -75,8 +177,7 @@ def compare_arrays(array1, array2):
     returns indices of items in array1 whcich are also entries of 
     array2
     '''
-    x = [i for i,item in enumerate(array1) if item in array2]
-    return np.array(x)
+    return np.flatnonzero(np.isin(array1, array2))
 
 def array_diff(array1, array2):
     '''
@@ -134,15 +235,46 @@ def handle_comments(d):
 def remove_duplicates(comments):
     '''
     returns unique values and indices of last occurrence
+    (comments can be e.g. integer codes of CommentColumn)
     '''
-    unique = np.unique(comments)
-    indices = []
-    for u in unique:
-        last_occur = np.argwhere(comments==u)[-1][0]
-        indices.append(last_occur)
-        
+    comments = np.asarray(comments)
+    # first occurrence in the reversed array is the last one
+    unique, first = np.unique(comments[::-1], return_index=True)
+    indices = comments.shape[0] - 1 - first
     return unique, indices
 
+def row_mode(sig):
+    '''
+    most common value in every row of a 2D array
+    (the smallest one if there are several), shape (N,1)
+    '''
+    s = np.sort(sig, axis=1)
+    n_columns = s.shape[1]
+    new = np.ones(s.shape, dtype=bool)
+    np.not_equal(s[:, 1:], s[:, :-1], out=new[:, 1:])
+    # runs of equal values in the flattened sorted array
+    starts = np.flatnonzero(new)
+    lengths = np.diff(np.append(starts, s.size))
+    rows = starts // n_columns
+    longest = np.maximum.reduceat(lengths, np.flatnonzero(starts % n_columns == 0))
+    best = np.flatnonzero(lengths == longest[rows])
+    _, first = np.unique(rows[best], return_index=True)
+    return s.ravel()[starts[best[first]]][:, np.newaxis]
+
+def window_means(csum, start, length, n):
+    '''
+    means of n windows [start+i, start+i+length) of every row
+    from cumulative sums csum (N,M+1) with zero first column.
+    Windows are cut at the end of the rows
+    '''
+    n_samples = csum.shape[1] - 1
+    counts = np.minimum(length, n_samples - np.arange(start, start + n))
+    if (counts == length).all():
+        return (csum[:, start+length:start+length+n] -
+                csum[:, start:start+n]) / length
+    stops = np.arange(start, start + n) + counts
+    return (csum[:, stops] - csum[:, start:start+n]) / counts
+
 def multi_window(sig,win):
     '''
     algorithm picking arrival times
@@ -153,20 +285,23 @@ def multi_window(sig,win):
     N - number of sonic tracks
     M - data points of oscilloscope
     win - 3-element list
+    Window means are computed from cumulative sums of the energy
+    for all tracks and samples at once
     '''
-    sig0 = sig - mode(sig,axis=1)[0] # remove shift in amplitude
-    E = sig0**2
-    N = E.shape[1]-win[2]-win[0]-1
-    BTA = np.zeros((E.shape[0],N)) # before term average
-    ATA = np.zeros((E.shape[0],N)) # after term average
-    DTA = np.zeros((E.shape[0],N)) # delayed term average
-    iterator = np.arange(N)
-    for i in np.nditer(iterator):
-        BTA[:,i] = np.mean(E[:,i:i+win[0]],axis=1)
-        ATA[:,i] = np.mean(E[:,i+win[0]:i+win[0]+win[1]],axis=1)
-        DTA[:,i] = np.mean(E[:,i+win[0]:i+win[0]+win[2]],axis=1)
-    r = ATA/BTA + DTA/BTA
-    return r/10
+    E = sig - row_mode(sig) # remove shift in amplitude
+    E *= E
+    N = max(E.shape[1]-win[2]-win[0]-1, 0)
+    csum = np.empty((E.shape[0], E.shape[1] + 1))
+    csum[:, 0] = 0
+    np.cumsum(E, axis=1, out=csum[:, 1:])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        BTA = window_means(csum, 0, win[0], N) # before term average
+        ATA = window_means(csum, win[0], win[1], N) # after term average
+        DTA = window_means(csum, win[0], win[2], N) # delayed term average
+        ATA += DTA
+        ATA /= BTA
+    ATA /= 10
+    return ATA
 
 def get_list(yAxisName,WaveTypes):
     # l = [yAxisName + ,WaveTypes[0],]
@@ -1,24 +1,133 @@
+import os
+import re
+import struct
 import numpy as np
-# import re
-import regex as re
-
-def read_TRC(filename):
-    # with open(directory + files[0]) as f:
-    with open(filename) as f:
-        text = f.read()
-        # print("reading %s ..."%(filename.split('/')[-1]))
-    """
-    regex corresponding to a line with 2 fload\scientific numbers separated by a whitespace or \t
-    """
+
+# Tektronix header: instrument line and time stamp line
+HEADER_LINES = 2
+# binary files store time in seconds, ASCII files in microseconds
+TIME_SCALE = 1e6
+# extensions of the sonic files that can be read
+SONIC_EXTENSIONS = ['.trc', '.isf']
+
+
+def read_waveform(filename, header=False):
+    '''
+    read a sonic trace in any of the supported formats:
+    Tektronix ASCII .TRC, LeCroy binary .trc (WAVEDESC)
+    and Tektronix .isf.
+    Returns (n_points, 2) float array of time (us) and amplitude,
+    or the array and the text of the header if header is True.
+    Raises IOError if the file is malformed
+    '''
+    with open(filename, 'rb') as f:
+        data = f.read()
+    extension = os.path.splitext(filename)[1].lower()
+    if b'WAVEDESC' in data[:64]:
+        parse = parse_lecroy
+    elif extension == '.isf':
+        parse = parse_isf
+    else:
+        parse = parse_ascii
     try:
-        expr = '\n-?\d+\.?\d+\E?-?\d+.+[-+]?\d+\.?\d+\E?[-+]?\d+\n'
-        match = re.search(expr,text) # get beginning of the data
-        text = text[match.start():-1] # search starting from the beginning of the data
-        expr = '[-+]?\d+\.\d+E?[-+]?\d{0,3}'
-        data = re.findall(expr,text)
-        time = np.array(data[::2])
-        signal = np.array(data[1::2])
-        values = np.column_stack((time,signal))
-        values = values.astype(np.float)
-        return values
-    except: print ('Error reading %s'%(filename))
+        values, text = parse(data)
+    except (ValueError, IndexError, struct.error) as e:
+        raise IOError('Error reading %s: %s' % (filename, e))
+    if header: return values, text
+    return values
+
+
+def read_TRC(filename, header=False):
+    '''
+    read a TRC file (Tektronix ASCII or LeCroy binary),
+    same as read_waveform
+    '''
+    return read_waveform(filename, header)
+
+
+def parse_ascii(text):
+    # skip the header
+    start = 0
+    for i in range(HEADER_LINES):
+        start = text.find(b'\n', start) + 1
+        if start == 0:
+            raise ValueError('no data')
+    values = np.array(text[start:].split(), dtype=float)
+    if values.size == 0 or values.size % 2 != 0:
+        raise ValueError('expected 2 columns')
+    values = values.reshape(-1, 2)
+    return values, text[:start].decode('latin-1').strip()
+
+
+def parse_lecroy(data):
+    '''
+    LeCroy binary waveform: optional SCPI block header,
+    WAVEDESC block (template LECROY_2_3), user text, trigger times
+    and the samples. amplitude = gain*sample - offset
+    '''
+    start = data.index(b'WAVEDESC')
+    # COMM_ORDER is 0 (big-endian) or 1 (little-endian): a zero
+    # word in either byte order
+    comm_order = data[start + 34:start + 36]
+    order = '>' if comm_order == b'\0\0' else '<'
+    comm_type, = struct.unpack_from(order + 'h', data, start + 32)
+    # lengths of the blocks before the samples
+    blocks = struct.unpack_from(order + '7l', data, start + 36)
+    n_bytes = blocks[6]
+    first = start + sum(blocks[:6])
+    sample = np.dtype(order + ('i2' if comm_type == 1 else 'i1'))
+    gain, offset = struct.unpack_from(order + 'ff', data, start + 156)
+    interval, = struct.unpack_from(order + 'f', data, start + 176)
+    horizontal_offset, = struct.unpack_from(order + 'd', data, start + 180)
+    if first + n_bytes > len(data):
+        raise ValueError('file is shorter than the wave array')
+    samples = np.frombuffer(data, dtype=sample,
+                            count=n_bytes//sample.itemsize, offset=first)
+    time = horizontal_offset + interval*np.arange(samples.shape[0])
+    values = np.column_stack((time*TIME_SCALE, gain*samples - offset))
+    name = data[start + 76:start + 92].split(b'\0')[0]
+    label = data[start + 96:start + 112].split(b'\0')[0]
+    text = (name + b' ' + label).decode('latin-1').strip()
+    return values, text
+
+
+# ISF preamble keys (short forms, long forms start with them)
+ISF_KEYS = ['BYT_N', 'BN_F', 'BYT_O', 'NR_P', 'XIN', 'PT_O', 'XZE',
+            'YMU', 'YOF', 'YZE']
+
+
+def parse_isf(data):
+    '''
+    Tektronix .isf: ASCII preamble (WFMPRE) and the CURVE block
+    #<n><length><samples>. amplitude = (sample - YOFF)*YMULT + YZERO
+    '''
+    curve = re.search(b'CURV[A-Z]* #', data)
+    if curve is None:
+        raise ValueError('no curve block')
+    preamble = data[:curve.start()].decode('latin-1')
+    fields = {}
+    for field in preamble.split(';'):
+        words = field.split(':')[-1].strip().split(None, 1)
+        if len(words) < 2: continue
+        for key in ISF_KEYS:
+            if words[0].startswith(key):
+                fields[key] = words[1].strip('"')
+    block = curve.end()
+    n_digits = int(data[block:block + 1])
+    n_bytes = int(data[block + 1:block + 1 + n_digits])
+    first = block + 1 + n_digits
+    if first + n_bytes > len(data):
+        raise ValueError('file is shorter than the curve')
+    order = '>' if fields.get('BYT_O', 'MSB') == 'MSB' else '<'
+    kind = 'u' if fields.get('BN_F', 'RI') == 'RP' else 'i'
+    sample = np.dtype(order + kind + fields.get('BYT_N', '2'))
+    samples = np.frombuffer(data, dtype=sample,
+                            count=n_bytes//sample.itemsize, offset=first)
+    x_increment = float(fields['XIN'])
+    x_zero = float(fields.get('XZE', 0))
+    point_offset = float(fields.get('PT_O', 0))
+    time = x_zero + x_increment*(np.arange(samples.shape[0]) - point_offset)
+    amplitude = ((samples - float(fields.get('YOF', 0))) *
+                 float(fields['YMU']) + float(fields.get('YZE', 0)))
+    return np.column_stack((time*TIME_SCALE, amplitude)), preamble.strip()
+
@@ -1,6 +1,6 @@
 import re
 import numpy as np
-from scipy.stats.mstats import mode
+from TCI.lib.functions import multi_window
 # from numba import jit # for optimization
 
 # @jit 
@@ -45,28 +45,24 @@ def get_table(dictionary):
     (1) string keys
     (2) each entries is a nparray (Nx2) 1 - time,2 - amplitude
     Output:
-    3D numpy array. 1st dimension - time or amplitude
-    2nd dimension - number of file
-    3rd dimension - datapoints
+    time - 1D array, time of the first file (shared by all files)
+    amplitude - 2D array. 1st dimension - number of file
+    2nd dimension - datapoints
     '''
-    # get length of arrays (must be the same)
-    Npoints = dictionary.values()[0].shape[0]
     # get # of arrays
-    names = dictionary.keys()
+    names = list(dictionary.keys())
     names.sort(key=natural_keys)
     # print names
     Nfiles = len(names)
+    # get length of arrays (must be the same)
+    time = dictionary[names[0]][:,0].copy()
+    Npoints = time.shape[0]
     # allocate space
-    x = np.zeros((Nfiles,Npoints))
     y = np.zeros((Nfiles,Npoints))
     # loop over files
     for k in range(Nfiles): # use for cause needs to be sorted
-        x[k] = dictionary[names[k]][:,0]
-        y[k] = dictionary[names[k]][:,1] 
-    # Create table
-    table = np.array((x,y))
-    # print table
-    return table
+        y[k] = dictionary[names[k]][:,1]
+    return time, y
 
 # No jit doesn't work for some reason
 # @jit
@@ -131,31 +127,6 @@ def handle_comments(d):
     return new_comments
 
 
-def multi_window(sig,win):
-    '''
-    algorithm picking arrival times
-    the maximum amplitudes correspond
-    to sending and arriving times
-    n-dimensional extension
-    sig - (N,M) numpy array
-    N - number of sonic tracks
-    M - data points of oscilloscope
-    win - 3-element list
-    '''
-    sig0 = sig - mode(sig,axis=1)[0] # remove shift in amplitude
-    E = sig0**2
-    N = E.shape[1]-win[2]-win[0]-1
-    BTA = np.zeros((E.shape[0],N)) # before term average
-    ATA = np.zeros((E.shape[0],N)) # after term average
-    DTA = np.zeros((E.shape[0],N)) # delayed term average
-    iterator = np.arange(N)
-    for i in np.nditer(iterator):
-        BTA[:,i] = np.mean(E[:,i:i+win[0]],axis=1)
-        ATA[:,i] = np.mean(E[:,i+win[0]:i+win[0]+win[1]],axis=1)
-        DTA[:,i] = np.mean(E[:,i+win[0]:i+win[0]+win[2]],axis=1)
-    r = ATA/BTA + DTA/BTA
-    return r/10
-
 def get_list(yAxisName,WaveTypes):
     # l = [yAxisName + ,WaveTypes[0],]
     l1 = yAxisName + ' ' + WaveTypes[0]
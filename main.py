@@ -2,7 +2,10 @@ import sys, os
 from TCI.widgets.DataViewer import DataViewer
 from PySide import QtGui
 
-App = QtGui.QApplication(sys.argv)
-win = DataViewer()
-win.show()
-App.exec_()
+# the guard is needed since data files are parsed in worker
+# processes, which import this module on windows
+if __name__ == '__main__':
+    App = QtGui.QApplication(sys.argv)
+    win = DataViewer()
+    win.show()
+    App.exec_()
@@ -202,7 +202,7 @@ class CalculatorPlot(QtGui.QWidget):
         someKey = keys[0]
         npoints = len(self.findData(someKey))
         if self.parent:
-            self.indices = self.parent.indices
+            self.indices = self.parent.plottedRows()
         else:
             self.indices = np.arange(npoints)
         self.applyButton.setDisabled(False)
@@ -264,7 +264,8 @@ class CalculatorPlot(QtGui.QWidget):
         self.plt.showGrid(x=True, y=True)
         xlabel = self.xNameEdit.text()
         ylabel = self.yNameEdit.text()
-        self.indices = self.parent.indices
+        # same decimated rows as the curves of the main plot
+        self.indices = self.parent.plottedRows()
 
         for name in self.validItems():
             x = self.plotItems[name]['x'][self.indices]
@@ -141,12 +141,12 @@ class MohrCircles:
             elif self.parent.mainAxis == 'x':
                 ylabel = plotlist[-1]
                 xlabel = self.parent.modparams.param('Parameter').value()
-                x_data = self.parent.findData(xlabel)
-                y_data = self.parent.findData(ylabel)
-                x = x_data[self.parent.indices]
-                y = y_data[self.parent.indices]
+            # cursors slide along the drawn (decimated) rows of the curve
+            rows = self.parent.plotRows(plotlist[-1])
+            x = self.parent.findData(xlabel)[rows]
+            y = self.parent.findData(ylabel)[rows]
             for cursor in self.cursors:
-                cursor.setData(x,y)
+                cursor.setData(x, y, rows)
         else:  # if tree is inactive remove cursors
             for cursor in self.cursors:
                 self.parent.plt.removeItem(cursor)
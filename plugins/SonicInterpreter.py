@@ -7,16 +7,19 @@ from pyqtgraph.parametertree import types as pTypes
 from pyqtgraph.Point import Point
 import numpy as np
 import pickle
+from concurrent.futures import ProcessPoolExecutor, wait
 
 # custom modules
 from TCI.widgets.SonicViewer import SonicViewer
-from TCI.lib.readtrc import read_TRC
+from TCI.base_classes.SonicArchive import SonicArchive, EXTENSION
+from TCI.lib.readtrc import read_waveform, SONIC_EXTENSIONS
 from TCI.lib.functions import *
 from TCI.widgets.ShapeControlWidget import ShapeControlWidget
 from TCI.lib.logger import logger
 from TCI.widgets.InterpretationSettingsWidget import InterpretationSettingsWidget
 from TCI.widgets.BindingWidget import BindingWidget
 from TCI.lib.write_csv import write_csv
+from TCI.calculations.pickers import PICKERS
 
 BadBindingMessage = '''
 Duplicates found in the comments column.
@@ -37,6 +40,7 @@ class SonicInterpreter:
     def __init__(self, parent=None):
         self.parent = parent
         self.progressDialog = QtGui.QProgressDialog()
+        self.progressDialog.setWindowModality(QtCore.Qt.ApplicationModal)
         self.sonicViewer = SonicViewer(parent=parent, controller=self)
         self.interpretationSettings = InterpretationSettingsWidget()
         self.moduliWidget = BindingWidget(parents=[parent, self])
@@ -45,6 +49,9 @@ class SonicInterpreter:
         self.all_geo_indices = {}
         self.all_indices = {}
         self.all_times = {}
+        self.all_names = {}
+        # TRC headers: wave -> file name -> header text
+        self.headers = {"P":{}, "Sx":{}, "Sy":{}}
 
         if parent is not None:
             self.setupActions()
@@ -66,6 +73,7 @@ class SonicInterpreter:
             self.all_indices[self.current_data_set] = self.indices
             self.sonicViewer.plot_arrival_times_flag = False
             self.all_times[self.current_data_set] = self.times
+            self.all_names[self.current_data_set] = self.sonicViewer.names
 
         # get sonic table for the current data set
         if data_set in self.all_tables.keys():
@@ -75,6 +83,7 @@ class SonicInterpreter:
             self.geo_indices = self.all_geo_indices[data_set]
             self.indices = self.all_indices[data_set]
             self.times = self.all_times[data_set]
+            self.sonicViewer.names = self.all_names[data_set]
             self.sonicViewer.setIndices(self.indices, self.geo_indices)
             # self.sonicViewer.plot_arrival_times_flag = False
             length = self.parent.props['length']
@@ -93,12 +102,14 @@ class SonicInterpreter:
         files
         '''
         lastdir = self.parent.checkForLastDir()
-        filter_mask = "Sonic data files (*.TRC *.txt)"
+        filter_mask = "Sonic data files (*.TRC *.trc *.isf *%s)"%(EXTENSION)
         filenames = QtGui.QFileDialog.getOpenFileNames(None,
             FILE_DIALOG_TITLE, "%s"%(lastdir), filter_mask)[0]
 
         if filenames != []:
-            self.loadData(filenames)
+            if filenames[0].endswith(EXTENSION):
+                if not self.loadArchive(filenames[0]): return
+            elif not self.loadData(filenames): return
             self.addSonicTab()
             self.bindData()
             self.sonicViewer.setEnabled()
@@ -117,38 +128,105 @@ class SonicInterpreter:
 
     def loadData(self, filenames):
         '''
-        Read the supplied files.
-        show progress dialog during that operations
+        Read the supplied files in a process pool.
+        Results are collected in the order of filenames,
+        the progress dialog is updated and the GUI stays responsive.
+        Returns False if loading was canceled in the progress dialog
         '''
-        n_files = len(filenames)
         raw_data = {"P":{}, "Sx":{}, "Sy":{}}
-        self.progressDialog.show()
-
-        # iterate through files
-        i = 0
+        self.headers = {"P":{}, "Sx":{}, "Sy":{}}
+        # determine what wave each file pertains to
+        wave_files = []
         for f in filenames:
             fdir, fname = os.path.split(f)
             # check file extension
-            if '.TRC' in fname:
-                waves = read_TRC(f)
-                # determine what wave this thing pertains to
-                wave_type_inferred = False
-                for wave_name in WAVE_TYPES:
-                    if wave_name  in fname:
-                        raw_data[wave_name][fname] = waves
-                        wave_type_inferred = True
-                if not wave_type_inferred:
-                    logger.error("Could not infer wave type for %s"%(fname))
-            else:
+            if os.path.splitext(fname)[1].lower() not in SONIC_EXTENSIONS:
                 logger.error('unknown extension in %s'%(fname))
-            i += 1
-            self.progressDialog.setValue(float(i)/n_files*100)
+                continue
+            wave_names = [w for w in WAVE_TYPES if w in fname]
+            if wave_names == []:
+                logger.error("Could not infer wave type for %s"%(fname))
+                continue
+            wave_files.append((f, wave_names))
+
+        n_files = len(wave_files)
+        self.progressDialog.reset()
+        self.progressDialog.setValue(0)
+        self.progressDialog.show()
+        canceled = False
+        with ProcessPoolExecutor() as pool:
+            futures = [pool.submit(read_waveform, f, True)
+                       for f, w in wave_files]
+            for i, future in enumerate(futures):
+                # keep processing events while the file is parsed
+                while not future.done() and not canceled:
+                    wait([future], timeout=0.05)
+                    QtGui.QApplication.processEvents()
+                    canceled = self.progressDialog.wasCanceled()
+                if canceled:
+                    for other in futures: other.cancel()
+                    break
+                f, wave_names = wave_files[i]
+                fname = os.path.split(f)[1]
+                try:
+                    waves, header = future.result()
+                except IOError as e:
+                    logger.error(str(e))
+                else:
+                    for wave_name in wave_names:
+                        raw_data[wave_name][fname] = waves
+                        self.headers[wave_name][fname] = header
+                self.progressDialog.setValue(int(100.*(i + 1)/n_files))
         self.progressDialog.hide()
+        if canceled:
+            logger.info('Loading sonic files canceled')
+            return False
 
         # organize data
         self.sonicViewer.setRawData(raw_data)
         self.setEnabled()
         # self.parent.tabWidget.setCurrentWidget(self.sonicViewer)
+        return True
+
+    def loadArchive(self, filename):
+        '''
+        open a sonic archive saved by saveArchive.
+        Returns False if the file could not be opened
+        '''
+        archive = SonicArchive(filename)
+        try:
+            archive.open()
+        except IOError as e:
+            logger.error(str(e))
+            return False
+        self.headers = {}
+        for wave in WAVE_TYPES:
+            self.headers[wave] = dict(zip(archive.names[wave],
+                                          archive.headers[wave]))
+        self.sonicViewer.setArchive(archive)
+        self.setEnabled()
+        return True
+
+    def raiseSaveArchiveDialog(self):
+        lastdir = str(self.parent.checkForLastDir())  # convert normal string
+        fname, filter = QtGui.QFileDialog.getSaveFileName(self.parent, "",
+                                                          lastdir,
+                                                          "*" + EXTENSION)
+        if (fname):
+            if not fname.endswith(EXTENSION): fname += EXTENSION
+            self.saveArchive(fname)
+        else:
+            logger.debug("File name not set")
+
+    def saveArchive(self, fname):
+        '''
+        pack loaded sonic tracks into one file that is opened
+        much faster than the TRC files
+        '''
+        archive = SonicArchive(fname)
+        archive.pack(self.sonicViewer.names, self.sonicViewer.table,
+                     self.headers)
+        archive.save()
 
 
     def setupActions(self):
@@ -190,6 +268,14 @@ class SonicInterpreter:
         # self.pickArrivalsAction.setDisabled(True)
 
         self.shapeArrivalsAction = QtGui.QAction('Shape pick', self.parent)
+        # automatic pickers
+        self.autoPickActions = {}
+        for method in sorted(PICKERS.keys()):
+            self.autoPickActions[method] = QtGui.QAction(method, self.parent)
+        self.multiWindowPickAction = QtGui.QAction('Multi-window',
+                                                   self.parent)
+        self.relativePickAction = QtGui.QAction('Relative pick', self.parent)
+        self.detectFrontsAction = QtGui.QAction('Detect fronts', self.parent)
         self.moduliAction = QtGui.QAction('Elastic moduli', self.parent)
         self.moduliAction.setDisabled(True)
         # self.handPickArrivalsAction.setDisabled(True)
@@ -214,6 +300,8 @@ class SonicInterpreter:
             'Export Arrival Times', self.parent)
         self.exportModuliAction = QtGui.QAction(
             'Export Moduli', self.parent)
+        self.saveArchiveAction = QtGui.QAction(
+            'Save sonic archive', self.parent)
 
         # dict to store actions for y Axis
         self.yAxisActions = {}
@@ -239,6 +327,8 @@ class SonicInterpreter:
                                           self.exportArrivalsAction)
         self.parent.fileMenu.insertAction(self.parent.exitAction,
                                           self.exportModuliAction)
+        self.parent.fileMenu.insertAction(self.parent.exitAction,
+                                          self.saveArchiveAction)
         # menubar entry corresponding to sonic widget
         self.menu = menuBar.addMenu('Sonic')
         viewMenu = self.parent.viewMenu
@@ -276,6 +366,12 @@ class SonicInterpreter:
         # INTERPRETATION MENU
         # self.intMenu.addAction(self.pickArrivalsAction)
         self.intMenu.addAction(self.shapeArrivalsAction)
+        self.autoPickMenu = self.intMenu.addMenu('Auto pick')
+        for method in sorted(self.autoPickActions.keys()):
+            self.autoPickMenu.addAction(self.autoPickActions[method])
+        self.autoPickMenu.addAction(self.multiWindowPickAction)
+        self.intMenu.addAction(self.relativePickAction)
+        self.intMenu.addAction(self.detectFrontsAction)
         self.intMenu.addAction(self.moduliAction)
 
         # TRANSFORM MENU
@@ -316,42 +412,39 @@ class SonicInterpreter:
         geo_times = self.parent.findData(self.parent.timeParam)
 
         # filter out empty comments
-        non_empty = [i for i, c in enumerate(comments) if c != b'' and c!='']
-        comments = comments[non_empty]
+        non_empty = np.flatnonzero(comments.nonEmpty())
+        codes = comments.codes[non_empty]
         filtered_times = geo_times[non_empty]
 
         # check if there are any duplicates
-        comments, ind = remove_duplicates(comments)
-        filtered_times = filtered_times[ind]
+        codes, ind = remove_duplicates(codes)
+        comments = np.array(comments.labels)[codes]
+        # in alphabetical order
+        order = np.argsort(comments)
+        comments = comments[order]
+        filtered_times = filtered_times[ind[order]]
         # idk why but these values are not sorted yet
         # but they should be
         filtered_times.sort()
 
         # find same strings in sonic file names
         for wave in WAVE_TYPES:
-            wave_files = list(self.sonicViewer.data[wave].keys())
+            wave_files = list(self.sonicViewer.names[wave])
             # natural keys is a function from lib.functions
             # wave_files.sort(key=natural_keys)
             indices = compare_arrays(comments, wave_files)
             # which items wave_keys are not in comments
             spurious_entries = array_diff(wave_files, comments)
-            for e in spurious_entries:
-                del self.sonicViewer.data[wave][wave_files[e]]
+            if len(spurious_entries) > 0:
+                self.sonicViewer.removeTracks(wave, spurious_entries)
 
             # this is what we really need
             self.times[wave] = filtered_times[indices]
             self.indices[wave] = np.arange(len(filtered_times[indices]))
             self.geo_indices[wave] = compare_arrays(geo_times, self.times[wave])
 
-        # rebuild sonic table
-        if spurious_entries != []:
-            self.sonicViewer.createTable()
-
         self.sonicViewer.setIndices(self.indices, self.geo_indices)
 
-        # we don't need those anymore
-        self.sonicViewer.data = {}
-
         # set initial length for moduli calculation
         length = float(self.parent.props['length'])
         self.interpretationSettings.lengthLine.setValue(length)
@@ -396,9 +489,18 @@ class SonicInterpreter:
         self.sxWaveAction.triggered.connect(self.sonicViewer.togglePlotVisibility)
         self.syWaveAction.triggered.connect(self.sonicViewer.togglePlotVisibility)
         self.shapeArrivalsAction.triggered.connect(self.activateShapePicking)
+        for method, action in self.autoPickActions.items():
+            action.triggered.connect(
+                lambda method=method: self.autoPickArrivals(method))
+        self.multiWindowPickAction.triggered.connect(
+            self.multiWindowPickArrivals)
+        self.relativePickAction.triggered.connect(self.relativePickArrivals)
+        self.detectFrontsAction.triggered.connect(
+            lambda: self.sonicViewer.detectFronts())
         self.showArrivalsAction.triggered.connect(self.sonicViewer.plot)
         self.exportArrivalsAction.triggered.connect(self.raiseExportArrivalDialog)
         self.exportModuliAction.triggered.connect(self.raiseExportModuliDialog)
+        self.saveArchiveAction.triggered.connect(self.raiseSaveArchiveDialog)
         self.moduliAction.triggered.connect(self.interpretationSettings.show)
         self.invertYAction.triggered.connect(self.sonicViewer.plot)
         self.autoScaleAction.triggered.connect(self.sonicViewer.autoScalePlots)
@@ -467,6 +569,48 @@ class SonicInterpreter:
 
         self.shapeControlWidget = ShapeControlWidget(parent=self.sonicViewer)
 
+    def pickingInterval(self):
+        '''
+        time range shown in the plots, pickers search in it
+        (zoom in to skip the transmitter pulse)
+        '''
+        active_waves = self.activeWaves()
+        if active_waves == []: return None
+        plot = self.sonicViewer.plots[active_waves[0]]
+        return plot.viewRange()[0]
+
+    def autoPickArrivals(self, method):
+        '''
+        pick arrivals of all tracks in the time range shown
+        '''
+        self.sonicViewer.autoPickArrivals(method, self.pickingInterval())
+        self.showPickedArrivals()
+
+    def multiWindowPickArrivals(self):
+        '''
+        sender and arrival times of the shown tracks from the
+        multi-window energy ratios (see SonicViewer.pickArrivals)
+        '''
+        for wave in self.activeWaves():
+            self.sonicViewer.pickArrivals(wave)
+        self.showPickedArrivals()
+
+    def relativePickArrivals(self):
+        '''
+        arrivals of all tracks from cross-correlation of the time range
+        shown, anchored to the current arrivals on a few tracks
+        '''
+        self.sonicViewer.relativePickArrivals(
+            interval=self.pickingInterval())
+        self.showPickedArrivals()
+
+    def showPickedArrivals(self):
+        self.exportArrivalsAction.setEnabled(True)
+        self.exportModuliAction.setEnabled(True)
+        self.showArrivalsAction.trigger()
+        self.moduliAction.setEnabled(True)
+        self.sonicViewer.plot()
+
     def setViewerMode(self):
         if self.waveFormAction.isChecked():
             mode = VIEW_MODES[1]
@@ -547,6 +691,7 @@ class SonicInterpreter:
         self.invertYAction.setEnabled(enabled)
         self.yAxisMenu.setEnabled(enabled)
         self.menu.setEnabled(enabled)
+        self.saveArchiveAction.setEnabled(enabled)
 
     def runModuliWidget(self):
         '''
@@ -1,4 +1,5 @@
 import pyqtgraph as pg
+from pyqtgraph.Qt import QtCore
 
 DATA_VIEWER_TREE_COLORS = [
     (255, 213, 102),    # Ev
@@ -45,3 +46,5 @@ MOHR_CIRCLE_PEN = pg.mkPen(color=(0, 0, 0), width=2)
 CROSS_HAIR_PEN = pg.mkPen(color=(12, 0, 130), width=1)
 
 ARRIVALS_PEN = pg.mkPen(color=(72, 209, 204), width=2)
+
+FRONTS_PEN = pg.mkPen(color=(0, 255, 0), width=2, style=QtCore.Qt.DashLine)
@@ -0,0 +1,127 @@
+import numpy as np
+from TCI.lib.functions import append_rows, remove_duplicates, decimate
+from TCI.base_classes.LodPyramid import LodPyramid
+
+'''
+Description:
+Data handling functions from lib.functions and
+level of detail pyramid used for plotting
+'''
+
+# appending to a buffer with spare rows
+buffer = np.zeros([0, 3])
+n = 0
+for i in range(10):
+    buffer, n = append_rows(buffer, n, np.ones([5, 3])*i)
+assert n == 50 and buffer.shape[0] >= 50
+assert (buffer[45:50] == 9).all()
+
+# last occurrences of unique values
+unique, indices = remove_duplicates(np.array([3, 1, 3, 2, 1]))
+assert list(unique) == [1, 2, 3]
+assert list(indices) == [4, 3, 2]
+
+# decimation keeps peaks and forced rows
+x = np.linspace(0, 1, 100000)
+y = np.sin(50*x)
+y[12345] = 10.
+keep = np.zeros(x.shape[0], dtype=bool)
+keep[54321] = True
+rows = decimate([x, y], 1000, keep)
+assert rows.sum() <= 1001
+assert rows[12345] and rows[54321]
+assert rows[0] and rows[-1]
+
+# level of detail: a few rows per pixel, extremes are kept
+pyramid = LodPyramid(y)
+rows = pyramid.rows(0, y.shape[0], 500)
+assert rows.shape[0] < 2500
+assert 12345 in rows
+assert y[rows].min() == y.min()
+# short intervals are drawn completely
+assert (pyramid.rows(100, 600, 500) == np.arange(100, 600)).all()
+# rows appended to a followed file extend the levels in place
+grown = LodPyramid(y[:50001])
+grown.extend(y[:70003])
+grown.extend(y)
+for level, fresh in zip(grown.levels, pyramid.levels):
+    assert (level[0] == fresh[0]).all() and (level[1] == fresh[1]).all()
+
+# tracks with other dt are resampled onto a common grid
+from TCI.lib.functions import resample_tracks
+time = np.array([np.arange(5)*2., np.arange(5)*2. + 1])
+amplitude = np.array([np.arange(5)*2., np.arange(5)*4.])
+resampled = resample_tracks(time, amplitude, 1., 9)
+assert np.allclose(resampled[0], np.arange(9))
+assert np.allclose(resampled[1], np.arange(9)*2)
+
+# 8-bit digitizer levels are stored exactly as int8 codes
+from TCI.lib.functions import quantize
+amplitude = np.array([np.arange(-10, 30)*0.08, np.linspace(0, 1, 40)])
+codes, scale, zero = quantize(amplitude, np.int8)
+assert codes.dtype == np.int8
+restored = codes*scale[:, np.newaxis] + zero[:, np.newaxis]
+assert np.allclose(restored[0], amplitude[0])
+assert np.abs(restored[1] - amplitude[1]).max() <= scale[1]/2 + 1e-12
+
+# energy ratios of all samples from cumulative sums
+from TCI.lib.functions import multi_window, row_mode
+sig = np.round(np.random.randn(5, 300)*4)*0.08
+sig[:, 150:] += np.sin(np.arange(150))
+assert (row_mode(np.array([[2., 1., 2., 1.], [3., 0., 3., 3.]])) ==
+        [[1.], [3.]]).all()
+win = [20, 10, 30]
+r = multi_window(sig, win)
+E = (sig - row_mode(sig))**2
+i = 123
+before = E[:, i:i+win[0]].mean(axis=1)
+after = E[:, i+win[0]:i+win[0]+win[1]].mean(axis=1)
+delayed = E[:, i+win[0]:i+win[0]+win[2]].mean(axis=1)
+assert r.shape == (5, 300 - win[2] - win[0] - 1)
+assert np.allclose(r[:, i], (after/before + delayed/before)/10)
+
+# automatic pickers find the onset of every track at once
+from TCI.calculations.pickers import pick_arrivals, PICKERS
+rng = np.random.RandomState(0)
+k = np.arange(2500)
+time = k*0.04 - 4
+onset = rng.randint(800, 1500, 50)
+after = np.maximum(k - onset[:, np.newaxis], 0)
+amplitude = rng.randn(50, 2500)*0.05 + \
+    (after > 0)*np.sin(after*0.3)*np.exp(-after/300.)*2
+for method in PICKERS:
+    arrivals = pick_arrivals(time, amplitude, method, interval=(10, 100))
+    assert np.abs(arrivals - time[onset]).max() < 1.
+# nothing is picked outside of the interval
+assert np.isnan(pick_arrivals(time, amplitude, 'AIC', (200, 300))).all()
+
+# relative picking: delays between consecutive tracks from
+# cross-correlation, anchored to arrivals picked on a few tracks
+from TCI.calculations.pickers import consecutive_delays, anchor_delays
+onset = 900 + 100*np.sin(np.linspace(0, 3, 50))
+after = np.maximum(k - onset[:, np.newaxis], 0)
+amplitude = rng.randn(50, 2500)*0.02 + \
+    (after > 0)*np.sin(after*0.3)*np.exp(-after/300.)*2
+delays = consecutive_delays(time, amplitude, interval=(10, 100), max_lag=50)
+assert np.abs(delays - (onset - onset[0])).max() < 0.2
+anchors = [0, 25, 49]
+arrivals = anchor_delays(time, delays, anchors, time[0] + onset[anchors]*0.04)
+assert np.abs(arrivals - (time[0] + onset*0.04)).max() < 0.01
+
+# straight fronts found with a Hough transform of the edge map
+from TCI.calculations.lines import detect_fronts
+onset = 900 + np.linspace(0, 100, 50)
+after = np.maximum(k - onset[:, np.newaxis], 0)
+amplitude = rng.randn(50, 2500)*0.02 + \
+    (after > 0)*np.sin(after*0.3)*np.exp(-after/300.)*2
+amplitude[:, 100:110] += 4*np.sin(np.arange(10))    # transmitter
+edges, lines, arrivals = detect_fronts(time, amplitude, n_lines=2)
+assert edges.shape == amplitude.shape and arrivals.shape == (2, 50)
+front = np.abs(arrivals - time[0] - onset*0.04).max(axis=1).argmin()
+assert np.abs(arrivals[front] - time[0] - onset*0.04).max() < 0.2
+assert np.abs(arrivals[1 - front] - time[100]).max() < 1.
+
+# indices of the items that are also in the other array
+from TCI.lib.functions import compare_arrays
+times = np.array([0.5, 1., 1.5, 2.])
+assert (compare_arrays(times, np.array([2., 1.])) == [1, 3]).all()
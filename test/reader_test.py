@@ -0,0 +1,290 @@
+import os
+import numpy as np
+import TCI
+from TCI.base_classes.InputReader import InputReader
+
+'''
+Description:
+Reading clf files without the GUI
+'''
+
+test_data_path = TCI.__path__[0] + "/test/test-data/"
+data_set1 = "1500psi/" + \
+    "_Training_Pc=1500 psi Sonic endcaps_Berea Mechanical Testing _2015-04-27_001.clf"
+data_set2 = "_Training_Berea SS _Berea SS Mechanical Properties 3000psi _2015-04-03_001.clf"
+
+reader = InputReader()
+names, units, values, comments = reader.read_clf(test_data_path + data_set1)
+assert len(names) == len(units) == values.shape[1]
+assert values.shape[0] == comments.shape[0]
+assert values.dtype == np.float64
+assert names[0] == "Time" and "Sig1" in names
+assert values[1, 0] == 1.
+# sonic file names are stored in comments
+assert b'_1P.TRC' in comments[:, 0]
+
+# file without comments
+names, units, values, comments = reader.read_clf(test_data_path + data_set2)
+assert values.shape[0] == comments.shape[0]
+assert (comments == b'').all()
+
+# streaming mode gives the same table chunk by chunk
+reader = InputReader()
+chunks = list(reader.read_clf_chunks(test_data_path + data_set2,
+                                     chunk_size=1000))
+assert len(chunks) > 1
+assert np.array_equal(np.concatenate([c[2] for c in chunks]), values)
+
+# memory-mapped file: rows are parsed on demand
+from TCI.base_classes.MappedClf import MappedClf
+clf_map = MappedClf(test_data_path + data_set2)
+assert clf_map.n_rows() == values.shape[0]
+assert np.array_equal(clf_map.rows(100, 200)[0], values[100:200])
+assert np.array_equal(clf_map.rows(0, None, 10)[0], values[::10])
+time = values[:, 0]
+start, stop = clf_map.findRows("Time", [time[100], time[200]])
+assert (start, stop) == (100, 201)
+clf_map.close()
+
+# several files parsed in parallel
+from concurrent.futures import ProcessPoolExecutor
+from TCI.base_classes.InputReader import parse_clf
+with ProcessPoolExecutor(2) as pool:
+    futures = [pool.submit(parse_clf, test_data_path + f)
+               for f in [data_set1, data_set2]]
+    parsed = [future.result() for future in futures]
+assert np.array_equal(parsed[1][2], values)
+
+# properties are parsed once from the text before the table
+properties = parsed[0][4]
+assert properties.findProperty("Test Parameters 3.Cluster.Value=") == \
+    "2.032999992371"
+assert properties.value("Length") == 2.032999992371
+assert properties.unit("Chamber Height") == "in"
+assert properties.findProperty("Endcap.Height") == "6.00250005722"
+
+# projection: only some of the columns are parsed
+reader = InputReader()
+columns = ["Time", "Sig1", "Ev"]
+p_names, p_units, p_values, p_comments = reader.read_clf(
+    test_data_path + data_set2, columns=columns)
+assert p_names == columns
+assert np.array_equal(p_values,
+                      values[:, [names.index(c) for c in columns]])
+assert "Pc" in reader.skipped_columns
+assert len(reader.skipped_columns) == len(names) - len(columns)
+
+# bad rows are skipped and reported with their line numbers
+import tempfile
+with open(test_data_path + data_set1, 'rb') as f:
+    lines = f.read().split(b'\n')
+lines[89] = lines[89].replace(b'\t', b'', 1)        # cell missing
+lines[94] = lines[94].replace(b'E+0', b'X+0', 1)    # not a number
+cells = lines[99].split(b'\t')
+cells[3] = b''                                      # empty cell
+lines[99] = b'\t'.join(cells)
+with tempfile.NamedTemporaryFile(suffix='.clf', delete=False) as f:
+    f.write(b'\n'.join(lines))
+reader = InputReader()
+names, units, values, comments = reader.read_clf(f.name)
+full_names = names
+# projection of a file with bad rows skips the same rows
+p_names, p_units, p_values, p_comments = reader.read_clf(
+    f.name, columns=["Time", "Sig1"])
+os.remove(f.name)
+assert reader.bad_lines == [90, 95]
+assert np.array_equal(p_values, values[:, [names.index("Time"),
+                                           names.index("Sig1")]])
+assert values.shape[0] == comments.shape[0]
+assert np.isnan(values).sum() == 1
+
+# errors of two rows that cancel out are still found
+with open(test_data_path + data_set1, 'rb') as f:
+    lines = f.read().split(b'\n')
+cells = lines[150].split(b'\t')
+lines[150] = b'\t'.join(cells[:3] + cells[4:])      # cell missing
+cells = lines[151].split(b'\t')
+lines[151] = b'\t'.join(cells[:3] + [b'1'] + cells[3:])  # cell added
+cells = lines[160].split(b'\t')
+cells[2] = b''                                      # empty cell
+lines[160] = b'\t'.join(cells)
+cells = lines[161].split(b'\t')
+cells[2] = b'1 2'                                   # two entries
+lines[161] = b'\t'.join(cells)
+with tempfile.NamedTemporaryFile(suffix='.clf', delete=False) as f:
+    f.write(b'\n'.join(lines))
+values = reader.read_clf(f.name)[2]
+os.remove(f.name)
+assert reader.bad_lines == [151, 152, 162]
+assert np.isnan(values).sum() == 1
+
+# a bad number cell drops the row whichever columns are read
+for column in ["Time", "Pc"]:
+    with open(test_data_path + data_set1, 'rb') as f:
+        lines = f.read().split(b'\n')
+    header = lines[[i for i, l in enumerate(lines)
+                    if l.startswith(b'Time')][0]].split(b'\t')
+    cells = lines[200].split(b'\t')
+    cells[[h.split()[0] for h in header].index(column.encode())] = b'1x'
+    lines[200] = b'\t'.join(cells)
+    with tempfile.NamedTemporaryFile(suffix='.clf', delete=False) as f:
+        f.write(b'\n'.join(lines))
+    full = reader.read_clf(f.name)[2]
+    first = reader.read_clf(f.name, columns=["Time", "Sig1"])[2]
+    later = reader.read_clf(f.name, columns=["Pc"])[2]
+    os.remove(f.name)
+    assert first.shape[0] == later.shape[0] == full.shape[0]
+    assert np.array_equal(later[:, 0], full[:, full_names.index("Pc")])
+
+# comments are stored as integer codes and unique labels
+from TCI.base_classes.CommentColumn import CommentColumn
+names, units, values, comments = reader.read_clf(test_data_path + data_set1)
+column = CommentColumn.fromBytes(comments)
+assert column.labels[0] == ''
+assert (column.nonEmpty() == (comments[:, 0] != b'')).all()
+assert column[np.flatnonzero(column.nonEmpty())[0]].endswith('.TRC')
+
+# sonic TRC files: header lines followed by time and amplitude
+from TCI.lib.readtrc import read_TRC
+waves = read_TRC(test_data_path + "1500psi/1500pc/_85Sx.TRC")
+assert waves.shape == (2500, 2)
+assert waves[0, 0] == -4. and waves[0, 1] == 0.08
+with tempfile.NamedTemporaryFile(suffix='.TRC', delete=False) as f:
+    f.write(b'TEKTRONIX\r\n18:17:20\r\n-4.0E+0 \t0.08\r\n-3.9E+0 \t0.x\r\n')
+try:
+    read_TRC(f.name)
+    assert False
+except IOError:
+    pass
+os.remove(f.name)
+
+# sonic archive: traces packed into one file and memory-mapped
+from TCI.lib.functions import get_table, natural_keys
+from TCI.base_classes.SonicTable import SonicTable
+from TCI.base_classes.SonicArchive import SonicArchive
+sonic_dir = test_data_path + "1500psi/1500pc/"
+raw_data = {"P": {}, "Sx": {}, "Sy": {}}
+headers = {"P": {}, "Sx": {}, "Sy": {}}
+for wave, fname in [("P", "_1P.TRC"), ("P", "_2P.TRC"), ("P", "_10P.TRC"),
+                    ("Sx", "_1Sx.TRC"), ("Sy", "_1Sy.TRC")]:
+    raw_data[wave][fname], headers[wave][fname] = read_TRC(
+        sonic_dir + fname, header=True)
+names = dict((w, sorted(raw_data[w], key=natural_keys)) for w in raw_data)
+table = dict((w, SonicTable.fromDict(raw_data[w])) for w in raw_data)
+time, amplitude = get_table(raw_data["P"])
+assert np.array_equal(table["P"].time, time)
+assert np.array_equal(table["P"].amplitudes(), amplitude)
+archive = SonicArchive(os.path.join(tempfile.mkdtemp(), "test.sonic.npz"))
+archive.pack(names, table, headers)
+archive.save()
+archive = SonicArchive(archive.filename)
+archive.open()
+assert archive.names["P"] == ["_1P.TRC", "_2P.TRC", "_10P.TRC"]
+assert archive.time["P"].ndim == 1
+assert isinstance(archive.amplitude["P"], np.memmap)
+assert np.array_equal(archive.table("P").amplitudes(), amplitude)
+assert archive.headers["Sx"][0].startswith("TEKTRONIX")
+# tracks are read only when needed and removed without copying
+sonic_table = archive.table("P")
+sonic_table.removeTracks([0])
+assert len(sonic_table) == 2
+assert np.array_equal(sonic_table.amplitudes([1]), amplitude[[2]])
+# one time axis per wave and an offset per track
+sonic_table.shift(1.5)
+assert np.array_equal(sonic_table.times(), time - 1.5)
+sonic_table.shift(1., indices=[0])
+assert sonic_table.times([0, 1]).shape == (2, time.shape[0])
+
+# binary waveforms: samples are scaled with the vertical gain and offset
+import struct
+from TCI.lib.readtrc import read_waveform
+samples = np.arange(-50, 50, dtype='>i2')
+preamble = (':WFMPRE:BYT_NR 2;BIT_NR 16;ENCDG BIN;BN_FMT RI;BYT_OR MSB;' +
+            'NR_PT 100;XINCR 4.0E-7;PT_OFF 0;XZERO -4.0E-6;XUNIT "s";' +
+            'YMULT 4.0E-4;YZERO 0.0E0;YOFF 10.0E0;YUNIT "V";:CURVE #3200')
+with tempfile.NamedTemporaryFile(suffix='.isf', delete=False) as f:
+    f.write(preamble.encode() + samples.tobytes() + b'\n')
+waves = read_waveform(f.name)
+os.remove(f.name)
+assert np.allclose(waves[:, 0], -4 + 0.4*np.arange(100))    # microseconds
+assert np.allclose(waves[:, 1], (samples - 10)*4e-4)
+
+wavedesc = bytearray(346)
+wavedesc[0:8] = b'WAVEDESC'
+struct.pack_into('<hh7l', wavedesc, 32, 0, 1, 346, 0, 0, 0, 0, 0, 100)
+struct.pack_into('<fff', wavedesc, 156, 0.01, 0.5, 0)
+struct.pack_into('<fd', wavedesc, 176, 1e-7, -2e-6)
+samples = np.arange(-50, 50, dtype='i1')
+with tempfile.NamedTemporaryFile(suffix='.trc', delete=False) as f:
+    f.write(b'#9000000446' + bytes(wavedesc) + samples.tobytes())
+waves = read_waveform(f.name)
+os.remove(f.name)
+assert np.allclose(waves[:, 0], -2 + 0.1*np.arange(100), atol=1e-6)
+assert np.allclose(waves[:, 1], 0.01*samples - 0.5)
+# big-endian file with 16-bit samples (COMM_ORDER 0, COMM_TYPE 1)
+struct.pack_into('>hh7l', wavedesc, 32, 1, 0, 346, 0, 0, 0, 0, 0, 400)
+struct.pack_into('>fff', wavedesc, 156, 0.01, 1., 0)
+struct.pack_into('>fd', wavedesc, 176, 1e-7, -2e-6)
+samples = np.arange(-100, 100, dtype='>i2')
+with tempfile.NamedTemporaryFile(suffix='.trc', delete=False) as f:
+    f.write(bytes(wavedesc) + samples.tobytes())
+waves = read_waveform(f.name)
+os.remove(f.name)
+assert waves.shape == (200, 2)
+assert np.allclose(waves[:, 1], 0.01*samples - 1.)
+# tracks with other sampling are resampled, irregular ones dropped
+tracks = {"_1P.TRC": raw_data["P"]["_1P.TRC"],
+          "_2P.TRC": raw_data["P"]["_2P.TRC"][::2],
+          "_3P.TRC": raw_data["P"]["_10P.TRC"][[0, 1, 5, 6]],
+          "_4P.TRC": raw_data["P"]["_10P.TRC"]}
+sonic_table = SonicTable.fromDict(tracks)
+assert sonic_table.names == ["_1P.TRC", "_2P.TRC", "_4P.TRC"]
+assert sonic_table.resampled == ["_2P.TRC"] and sonic_table.dropped == ["_3P.TRC"]
+assert np.allclose(sonic_table.amplitudes([1])[0, ::2], amplitude[1, ::2])
+
+# quantized amplitudes are dequantized only for the requested tracks
+sonic_table = SonicTable.fromDict(raw_data["P"])
+sonic_table.quantize(8)
+assert sonic_table.amplitude.dtype == np.int8
+assert np.allclose(sonic_table.amplitudes([2]), amplitude[[2]])
+archive = SonicArchive(os.path.join(tempfile.mkdtemp(), "test.sonic.npz"))
+archive.pack(names, dict(table, P=sonic_table))
+archive.save()
+archive = SonicArchive(archive.filename)
+archive.open()
+assert archive.amplitude["P"].dtype == np.int8
+assert np.allclose(archive.table("P").amplitudes(), amplitude)
+
+# transmitter shift is a separate stage: setting it again changes nothing
+sonic_table = SonicTable.fromDict(raw_data["P"])
+version = sonic_table.version
+sonic_table.setTransmitter(0.5)
+sonic_table.setTransmitter(0.5)
+assert sonic_table.transmitter_version == 1
+assert np.array_equal(sonic_table.times(), time - 0.5)
+assert np.array_equal(sonic_table.times(transmitter=False), time)
+assert sonic_table.version == version
+# archives keep it apart from the offsets, so it is not applied twice
+archive = SonicArchive(os.path.join(tempfile.mkdtemp(), "test.sonic.npz"))
+archive.pack(names, dict(table, P=sonic_table))
+archive.save()
+archive = SonicArchive(archive.filename)
+archive.open()
+assert np.array_equal(archive.table("P").times(), time - 0.5)
+assert np.array_equal(archive.table("P").times(transmitter=False), time)
+assert not archive.table("Sx").transmitterTimes().any()
+sonic_table.removeTracks([0])
+assert sonic_table.version == version + 1
+
+# picking results are cached per table version, least recent dropped
+from TCI.base_classes.PickingCache import PickingCache
+cache = PickingCache(size=2)
+keys = [PickingCache.key("P", "AIC", (w,), sonic_table, np.arange(2))
+        for w in range(3)]
+for i, key in enumerate(keys):
+    cache.put(key, i)
+assert len(cache) == 2 and cache.get(keys[0]) is None
+assert cache.get(keys[2]) == 2
+sonic_table.shift(1.)
+assert cache.get(PickingCache.key("P", "AIC", (2,), sonic_table,
+                                  np.arange(2))) is None
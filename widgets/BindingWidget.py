@@ -143,8 +143,11 @@ class BindingWidget(QtGui.QWidget):
             arrival_times -= corr
             # convert to seconds
             arrival_times *= arrival_time_units
-            # interpolate arrival times
-            interpolator = interp1d(self.controller.times[wave], arrival_times,
+            # interpolate arrival times between the picked tracks
+            # (tracks without an arrival are nan)
+            picked = ~np.isnan(arrival_times)
+            interpolator = interp1d(self.controller.times[wave][picked],
+                                    arrival_times[picked],
                                     bounds_error=False)
             interpolated_arrival_times =  interpolator(self.itimes)
 
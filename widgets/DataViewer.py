@@ -4,6 +4,7 @@
 # setConfigOption('useOpenGL', False)
 ###############
 import sys, os
+from concurrent.futures import ProcessPoolExecutor
 # sys.path.append('dataviewer_lib') # comment this line on build and put files from the lib directly to the same folder
 import numpy as np
 import PySide
@@ -13,6 +14,7 @@ from pyqtgraph.parametertree import Parameter, ParameterTree
 # from pyqtgraph.parametertree import types as pTypes
 from pyqtgraph.Point import Point
 from copy import copy
+from collections import OrderedDict
 
 # Custom modules
 # from TCI.base_widgets.CursorItem import CursorItem
@@ -23,12 +25,22 @@ from TCI.styles.setup_plot import setup_plot
 from TCI.styles.LineColors import DATA_VIEWER_TREE_COLORS, TREND_PEN
 from TCI.styles.LabelStyles import *
 from TCI.base_widgets.Slider import SliderWidget
-from TCI.base_classes.InputReader import InputReader
+from TCI.base_classes.InputReader import InputReader, parse_clf
+from TCI.base_classes.MappedClf import MappedClf
+from TCI.base_classes.DataSetCache import DataSetCache
+from TCI.base_classes.CommentColumn import CommentColumn
+from TCI.base_classes.LodPyramid import LodPyramid
 from TCI.lib.logger import logger
+from TCI.lib.functions import append_rows, decimate
 
 # Plugins
 from TCI.plugin_list import get_plugin_list
 
+# how often the followed file is checked for new rows (ms)
+FOLLOW_INTERVAL = 1000
+# plot width (pixels) to pick the level of detail before it is shown
+DEFAULT_PLOT_WIDTH = 1000
+
 BadHeaderMessage = '''Couldn't locate the header.
 Go to Preferences->Main settings and adjust the header parameters'''
 
@@ -60,11 +72,15 @@ class DataViewer(QtGui.QWidget):
     sigLoadDataSet = QtCore.Signal(str)
     # when creating a new dataset
     sigNewDataSet = QtCore.Signal(object)
+    # when a file of a batch is parsed - carries file name and future
+    sigDataSetParsed = QtCore.Signal(str, object)
 
     def __init__(self):
         super(DataViewer, self).__init__()
         self.settings = SettingsWidget()
         self.iReader = InputReader()
+        cache_size = self.settings.config()['Main parameters']['CacheSize']
+        self.cache = DataSetCache(max_size=int(cache_size)*1024**2)
         self.plugins = []   # list to store plugin items
         self.loadPlugins()
         self.setupGUI()
@@ -93,10 +109,31 @@ class DataViewer(QtGui.QWidget):
         self.allUnits = {}
         self.props = {}         # for extra data sa sample length, density, poro
         self.allProps = {}
+        self.allMaps = {}       # memory-mapped files of previewed datasets
+        self.allFileNames = {}  # clf files the datasets were read from
+        # lazy mode: columns that are read only when needed
+        self.lazyColumns = OrderedDict()    # name -> units
+        self.allLazyColumns = {}
+        # level of detail pyramids of columns (built when plotted)
+        self.pyramids = {}
+        self.allPyramids = {}
+        self.curves = {}        # plotted curves
+        # follow mode: new rows of a file that is still being written
+        # are appended to the data set
+        self.followedDataSet = None
+        self.followTimer = QtCore.QTimer()
+        self.followTimer.timeout.connect(self.readFollowedFile)
+        # process pool parsing files in batch mode (created on demand)
+        self.loadPool = None
+        self.sigDataSetParsed.connect(self.addParsedDataSet)
         self.settings.okButton.pressed.connect(self.settings.hide)
         self.exitAction.triggered.connect(sys.exit)
         self.settingsButton.triggered.connect(self.settings.show)
         self.loadButton.triggered.connect(self.requestLoad)
+        self.batchLoadButton.triggered.connect(self.requestBatchLoad)
+        self.previewButton.triggered.connect(self.requestPreview)
+        self.fullResolutionButton.triggered.connect(self.loadFullResolution)
+        self.followButton.triggered.connect(self.toggleFollow)
         self.crossHairButton.triggered.connect(self.toggleCrossHair)
 
     def loadPlugins(self):
@@ -145,42 +182,102 @@ class DataViewer(QtGui.QWidget):
          "%s"%(self.lastdir), "*.clf;;MAT files (*.mat)")
         self.load(filename)
 
+    def requestBatchLoad(self):
+        '''
+        opens file manager, gets several filenames,
+        calls batchLoad
+        '''
+        self.lastdir = self.checkForLastDir()
+        filenames = QtGui.QFileDialog.getOpenFileNames(self, "",
+         "%s"%(self.lastdir), "*.clf")
+        self.batchLoad(filenames[0])
+
+    def requestPreview(self):
+        '''
+        opens file manager, gets filename,
+        calls preview
+        '''
+        self.lastdir = self.checkForLastDir()
+        filename = QtGui.QFileDialog.getOpenFileName(self, "",
+         "%s"%(self.lastdir), "*.clf")
+        self.preview(filename)
+
     def findData(self, key):
+        if key in self.lazyColumns:
+            self.loadColumns(self.currentDataSetName)
         assert key in self.keys, "%s not found"%(key)
         i = self.keys.index(key)
         return self.data[:, i]
 
     def findDatainAllDatasets(self, dataset, key):
+        if key in self.allLazyColumns[dataset]:
+            self.loadColumns(dataset)
         i = self.allKeys[dataset].index(key)
         return self.allData[dataset][:, i]
 
     def findUnits(self, key):
+        if key in self.lazyColumns:
+            return self.lazyColumns[key]
         i = self.keys.index(key)
         return self.units[i]
 
-    def sliceData(self, nrows):
+    def columnNames(self):
+        '''
+        names of all columns including the ones not read yet
+        '''
+        return self.keys + list(self.lazyColumns.keys())
+
+    def loadColumns(self, dataSetName):
+        '''
+        read all columns that were skipped when the data set
+        was loaded in lazy mode in one pass over the file
+        '''
+        keys = list(self.allLazyColumns[dataSetName].keys())
+        headerexpr = self.settings.msWidget.getHeaderExpr()
+        filename = self.allFileNames[dataSetName]
+        logger.info('Reading columns %s of %s' % (keys, filename))
+        names, units, values, comments = self.iReader.read_clf(
+            filename, headerexpr, columns=keys)
+        n_rows = self.allData[dataSetName].shape[0]
+        if values.shape[0] != n_rows:
+            # the rows would not match the loaded ones
+            raise IOError('%s has %d rows instead of %d, reload it' %
+                          (filename, values.shape[0], n_rows))
+        for name in names:
+            del self.allLazyColumns[dataSetName][name]
+        self.allData[dataSetName] = np.hstack([self.allData[dataSetName],
+                                               values])
+        self.allKeys[dataSetName] = self.allKeys[dataSetName] + names
+        self.allUnits[dataSetName] = self.allUnits[dataSetName] + units
+        if dataSetName == self.currentDataSetName:
+            self.data = self.allData[dataSetName]
+            self.keys = self.allKeys[dataSetName]
+            self.units = self.allUnits[dataSetName]
+
+    def readSlicedData(self, filename, headerexpr, nrows):
         """
-        slice data so that the number of rows is less than nrows.
-        Leave the entries that contain comments
+        stream the file chunk by chunk and decimate every chunk,
+        so that only the decimated data is stored in memory.
+        Number of rows in the file is estimated from the length of
+        the rows in the first chunk
         """
-        datasize = self.data.shape[0]
-        # rows that will be included in the slice (initially none)
-        active_rows = np.zeros(datasize, dtype=bool)
-        # we will take every n-th row of all data
-        every_n = (datasize // nrows) + 1
-        # counter that will be reset when we leave a row in the slice
-        counter = 1
-        for i in range(datasize):
-            if self.comments[i] != b'' or counter == every_n:
-                active_rows[i] = 1
-                counter = 0
-            counter += 1
-
-        sliced_data = self.data[active_rows]
-        sliced_comments = self.comments[active_rows]
-
-        self.data = sliced_data
-        self.comments = sliced_comments
+        file_size = os.path.getsize(filename)
+        chunks = self.iReader.read_clf_chunks(filename, headerexpr)
+        data = []
+        comments = []
+        every_n = None
+        for names, units, values, chunk_comments in chunks:
+            if every_n is None:
+                datasize = int(file_size / self.iReader.row_length)
+                every_n = (datasize // nrows) + 1
+                logger.info('Streaming %s: ~%d rows, keeping 1 of %d' %
+                            (filename, datasize, every_n))
+            columns = [values[:, j] for j in range(values.shape[1])]
+            active_rows = decimate(columns, values.shape[0] // every_n,
+                                   chunk_comments[:, 0] != b'')
+            data.append(values[active_rows])
+            comments.append(chunk_comments[active_rows])
+        return names, units, np.concatenate(data), np.concatenate(comments)
 
     def load(self, filename):
         '''
@@ -189,11 +286,33 @@ class DataViewer(QtGui.QWidget):
         '''
         headerexpr = self.settings.msWidget.getHeaderExpr()
         slengthexpr = self.settings.msWidget.getSampleLengthExpr()
+        main_config = self.settings.config()['Main parameters']
+        max_points = int(main_config['MaxDataPoints'])
+        # files larger than that are read chunk by chunk
+        stream_size = int(main_config['StreamingFileSize'])*1024**2
+        self.cache.max_size = int(main_config['CacheSize'])*1024**2
+        # in lazy mode only these columns are read at first
+        loaded_columns = [c.strip() for c in
+                          main_config['LoadedColumns'].split(',') if c.strip()]
+        lazy_columns = None
         if filename[0] == '': return
 
         elif filename[1] == u'*.clf':
-            clf_data = self.iReader.read_clf(filename[0])
-            # names, units, values, comments = clf_data
+            clf_data = self.cache.load(filename[0])
+            if clf_data is None and os.path.getsize(filename[0]) > stream_size:
+                clf_data = self.readSlicedData(filename[0], headerexpr,
+                                               max_points)
+                clf_data += (self.iReader.properties,)
+            elif clf_data is None and loaded_columns:
+                # not cached, since the cache stores whole files
+                columns = loaded_columns + [self.timeParam, self.sliderParam]
+                clf_data = self.iReader.read_clf(filename[0], headerexpr,
+                                                 columns=columns)
+                clf_data += (self.iReader.properties,)
+                lazy_columns = self.iReader.skipped_columns
+            elif clf_data is None:
+                clf_data = parse_clf(filename[0], headerexpr)
+                self.cache.save(filename[0], *clf_data)
 
         # Handle wrong header
         #     if tup==None:
@@ -206,33 +325,198 @@ class DataViewer(QtGui.QWidget):
         # If something's wrong
         # else: raise IOError('Cannot read this file format.')
 
+        self.setParsedData(filename[0], clf_data, lazy_columns)
+
+    def setParsedData(self, filename, clf_data, lazy_columns=None):
+        '''
+        store parsed clf data as a data set.
+        All rows are kept, the plot draws only as many of them
+        as the plot width needs (see plotRows)
+        clf_data - names, units, values, comments and PropertyTable
+        lazy_columns - name -> units of the columns that were not read
+        '''
         self.keys = clf_data[0]
         self.units = clf_data[1]
         self.data = clf_data[2]
-        self.comments = clf_data[3]
+        self.comments = CommentColumn.fromBytes(clf_data[3])
+        self.setLoadedData(filename, clf_data[4], lazy_columns)
 
-        max_points = self.settings.config()['Main parameters']['MaxDataPoints']
-        if self.data.shape[0] > max_points:
-            self.sliceData(max_points)
+    def batchLoad(self, filenames):
+        '''
+        parse several clf files in parallel in a process pool.
+        Cached files are added at once, the others are added
+        one by one as soon as they are parsed
+        '''
+        headerexpr = self.settings.msWidget.getHeaderExpr()
+        cache_size = self.settings.config()['Main parameters']['CacheSize']
+        self.cache.max_size = int(cache_size)*1024**2
+        for filename in filenames:
+            clf_data = self.cache.load(filename)
+            if clf_data is not None:
+                self.setParsedData(filename, clf_data)
+                continue
+            if self.loadPool is None:
+                self.loadPool = ProcessPoolExecutor()
+            logger.info('Parsing %s' % (filename))
+            future = self.loadPool.submit(parse_clf, filename, headerexpr)
+            # callback is called in a thread of the pool, the signal
+            # passes the result to the GUI thread
+            future.add_done_callback(lambda f, filename=filename:
+                                     self.sigDataSetParsed.emit(filename, f))
+
+    def addParsedDataSet(self, filename, future):
+        '''
+        add data set parsed in the process pool
+        '''
+        try:
+            clf_data = future.result()
+        except Exception as e:
+            logger.error('Could not read %s: %s' % (filename, e))
+            return
+        self.cache.save(filename, *clf_data)
+        self.setParsedData(filename, clf_data)
+
+    def preview(self, filename):
+        '''
+        memory-maps the file and reads only MaxDataPoints evenly
+        spaced rows from it. Rows of a slider interval can be read
+        later with loadFullResolution
+        '''
+        if filename[0] == '': return
+        headerexpr = self.settings.msWidget.getHeaderExpr()
+        main_config = self.settings.config()['Main parameters']
+        max_points = int(main_config['MaxDataPoints'])
+        clf_map = MappedClf(filename[0], headerexpr=headerexpr)
+        step = (clf_map.n_rows() // max_points) + 1
+        self.keys = clf_map.names
+        self.units = clf_map.units
+        self.data, comments = clf_map.rows(0, None, step)
+        self.comments = CommentColumn.fromBytes(comments)
+        self.setLoadedData(filename[0], clf_map.properties)
+        self.allMaps[self.currentDataSetName] = clf_map
+
+    def loadFullResolution(self):
+        '''
+        replace the previewed rows within the slider interval
+        with all rows of the file in this interval
+        (at most MaxDataPoints of them)
+        '''
+        if self.currentDataSetName not in self.allMaps: return
+        clf_map = self.allMaps[self.currentDataSetName]
+        main_config = self.settings.config()['Main parameters']
+        max_points = int(main_config['MaxDataPoints'])
+        interval = self.slider.interval()
+        start, stop = clf_map.findRows(self.sliderParam, interval)
+        step = ((stop - start) // max_points) + 1
+        logger.info('Reading rows %d-%d of %s' % (start, stop, clf_map.fname))
+        values, comments = clf_map.rows(start, stop, step)
+        comments = CommentColumn.fromBytes(comments)
 
-        # this should be in read_clf command
-        comments = []
-        for c in self.comments:
-            comments.append(c[0].decode('UTF-8'))
-        self.comments = np.array(comments)
-        # end
+        arr = self.findData(self.sliderParam)
+        before = arr < interval[0]
+        after = arr > interval[1]
+        self.data = np.concatenate([self.data[before], values,
+                                    self.data[after]])
+        self.comments = CommentColumn.concatenate(
+            [self.comments[before], comments, self.comments[after]])
+        self.addDataSet(self.currentDataSetName)
+        self.setCurrentDataSet(self.currentDataSetName)
+
+    def toggleFollow(self):
+        '''
+        start/stop following the file of the current data set.
+        Reading starts from the first row after the last loaded one
+        '''
+        self.followTimer.stop()
+        self.followedDataSet = None
+        if not self.followButton.isChecked(): return
+        if self.currentDataSetName is None:
+            self.followButton.setChecked(False)
+            return
+
+        name = self.currentDataSetName
+        filename = self.allFileNames[name]
+        headerexpr = self.settings.msWidget.getHeaderExpr()
+        # new rows contain all columns
+        if self.lazyColumns:
+            self.loadColumns(name)
+        clf_map = MappedClf(filename, headerexpr=headerexpr)
+        last_time = self.findData(self.timeParam)[-1]
+        row = clf_map.findRows(self.timeParam, [last_time, last_time])[1]
+        if row < clf_map.n_rows():
+            self.followOffset = int(clf_map.starts[row])
+        elif clf_map.n_rows() > 0:
+            self.followOffset = int(min(clf_map.ends[-1] + 1,
+                                        len(clf_map.map)))
+        else:
+            self.followOffset = len(clf_map.map)
+        self.followStringColumns = clf_map.string_columns
+        # order of the columns in the data set
+        self.followColumns = [clf_map.names.index(k) for k in self.keys]
+        clf_map.close()
+
+        logger.info('Following %s' % (filename))
+        self.followedDataSet = name
+        # buffers with spare rows, the data set is a view of them
+        self.followData = self.allData[name]
+        self.followCodes = self.comments.codes
+        self.followTimer.start(FOLLOW_INTERVAL)
+
+    def readFollowedFile(self):
+        '''
+        append rows written to the followed file since the last check
+        and update the plotted curves
+        '''
+        name = self.followedDataSet
+        values, comments, self.followOffset = self.iReader.read_clf_tail(
+            self.allFileNames[name], self.followOffset,
+            self.followStringColumns)
+        if values.shape[0] == 0: return
+        values = values[:, self.followColumns]
+        column = self.allComments[name]
+        codes = column.encode([c[0].decode('UTF-8') for c in comments])
+
+        n_rows = self.allData[name].shape[0]
+        self.followData, n = append_rows(self.followData, n_rows, values)
+        self.followCodes, n = append_rows(self.followCodes, n_rows, codes)
+        self.allData[name] = self.followData[:n]
+        self.allComments[name] = CommentColumn(self.followCodes[:n],
+                                               column.labels)
+        # add the new rows to the pyramids of the plotted columns
+        for entry, pyramid in self.allPyramids[name].items():
+            pyramid.extend(self.findDatainAllDatasets(name, entry))
+        if name == self.currentDataSetName:
+            self.data = self.allData[name]
+            self.comments = self.allComments[name]
+            self.updateCurves(values.shape[0])
+
+    def setLoadedData(self, filename, properties, lazy_columns=None):
+        '''
+        store data that was just read as a new data set
+        properties - PropertyTable of the file
+        lazy_columns - name -> units of the columns that were not read
+        '''
+        self.lazyColumns = lazy_columns or OrderedDict()
 
         # remember this name when we wanna save file
-        self.makeLastDir(filename[0]) # extract filename from absolute path
-        self.filename = os.path.basename(filename[0])
+        self.makeLastDir(filename) # extract filename from absolute path
+        self.filename = os.path.basename(filename)
+        # remove extension from name
+        dataSetName = os.path.splitext(self.filename)[0]
+        self.allFileNames[dataSetName] = filename
+        if self.followedDataSet == dataSetName:
+            self.followButton.setChecked(False)
+            self.toggleFollow()
 
         # read additional properties
         length_par = self.settings.config()['Main parameters']['SampleLengthParameter']
-        self.props['length'] = self.iReader.findProperty(length_par)
+        self.props = {'properties': properties}
+        self.props['length'] = properties.findProperty(length_par)
 
-        # remove extension from name
-        dataSetName = os.path.splitext(self.filename)[0]
         self.currentDataSetName = dataSetName
+        # forget the file map of the previous version of the data set
+        if dataSetName in self.allMaps:
+            self.allMaps.pop(dataSetName).close()
         self.addDataSet(dataSetName)
         self.setCurrentDataSet(dataSetName)
 
@@ -249,6 +533,8 @@ class DataViewer(QtGui.QWidget):
         self.allUnits[dataSetName] = self.units
         self.allKeys[dataSetName] = self.keys
         self.allData[dataSetName] = self.data
+        self.allLazyColumns[dataSetName] = self.lazyColumns
+        self.allPyramids[dataSetName] = {}
         if isNew:       # modify gui dataset entries
             self.addDataSetToGUI(dataSetName)
 
@@ -288,7 +574,10 @@ class DataViewer(QtGui.QWidget):
         # set current data dictionaries to new values
         self.currentDataSetName = dataSetName
         self.data = self.allData[dataSetName]
+        self.keys = self.allKeys[dataSetName]
         self.units = self.allUnits[dataSetName]
+        self.lazyColumns = self.allLazyColumns[dataSetName]
+        self.pyramids = self.allPyramids[dataSetName]
         self.props = self.allProps[dataSetName]
         self.indices = self.allIndices[dataSetName]
         self.dataSetMenu.setDefaultAction(self.dataSetButtons[dataSetName])
@@ -306,16 +595,16 @@ class DataViewer(QtGui.QWidget):
         logger.info( 'Modifying GUI: adding parameters to plot')
         # Modify parameter tree (i.r. plotting trend etc.)
         self.modparamlist = ModifyingParameters
-        self.modparamlist[1]['values'] = self.keys      # Parameter
+        self.modparamlist[1]['values'] = self.columnNames()      # Parameter
         # self.modparamlist[2]['values'] = self.data.keys() # Interval
-        self.modparamlist[5]['children'][1]['values'] = self.keys # Trend parameter
+        self.modparamlist[5]['children'][1]['values'] = self.columnNames() # Trend parameter
         # create parameter class instances()
         self.modparams = Parameter.create(name='Options',
                                           type='group',
                                           children=self.modparamlist)
         # modify main tree
         self.tree.clear()
-        self.tree.addItems(self.keys, DATA_VIEWER_TREE_COLORS)
+        self.tree.addItems(self.columnNames(), DATA_VIEWER_TREE_COLORS)
         self.modtree.setParameters(self.modparams, showTop=True)
         self.assignAttributes() # to get shorter names
 
@@ -417,6 +706,7 @@ class DataViewer(QtGui.QWidget):
         '''
         self.setAxisScale()
         self.updateLimits()
+        self.setIntervalRows()
         self.sigUpdatingPlot.emit(self)
         ### Ready to update
         # self.setAutoFillBackground(True)
@@ -432,6 +722,124 @@ class DataViewer(QtGui.QWidget):
         # send signal to plugins
         self.sigUpdatingPlot.emit(self)
 
+    def curveData(self, entry):
+        '''
+        x and y arrays of the plotted curve for an entry
+        in the data bar
+        '''
+        parameter = self.modparams.param('Parameter').value()
+        if self.mainAxis == 'x':
+            xlabel, ylabel = parameter, entry
+        else:
+            xlabel, ylabel = entry, parameter
+        rows = self.plotRows(entry)
+        xdata = self.findData(xlabel)[rows]
+        ydata = self.findData(ylabel)[rows]
+        if self.nullFlag.value():
+            if self.mainAxis == 'x': ydata -= ydata[0]
+            else: xdata -= xdata[0]
+        return xdata, ydata
+
+    def setIntervalRows(self):
+        '''
+        first and last+1 rows of data in the slider interval
+        and the mask of the rows in it
+        '''
+        self.intervalMask = np.zeros(self.data.shape[0], dtype=bool)
+        self.intervalMask[self.indices] = True
+        # the mask is a view of a buffer rows can be appended to
+        self.maskBuffer = self.intervalMask
+        rows = np.flatnonzero(self.intervalMask)
+        self.intervalCount = rows.shape[0]
+        if rows.shape[0] == 0:
+            self.intervalRange = (0, 0)
+        else:
+            self.intervalRange = (rows[0], rows[-1] + 1)
+        # rows of the range that are not in the interval
+        # (if the slider parameter is not monotonic)
+        self.intervalHasGaps = rows.shape[0] < (self.intervalRange[1] -
+                                                self.intervalRange[0])
+
+    def appendIntervalRows(self, n_new):
+        '''
+        extend the interval mask and range with the last n_new rows
+        of data, which were just appended
+        '''
+        n_old = self.data.shape[0] - n_new
+        interval = self.slider.interval()
+        arr = self.findData(self.sliderParam)[n_old:]
+        new = (arr >= interval[0]) & (arr <= interval[1])
+        self.maskBuffer, n = append_rows(self.maskBuffer, n_old, new)
+        self.intervalMask = self.maskBuffer[:n]
+        self.indices = self.intervalMask
+        rows = n_old + np.flatnonzero(new)
+        if rows.shape[0] > 0:
+            start = self.intervalRange[0]
+            if self.intervalCount == 0: start = rows[0]
+            self.intervalRange = (start, rows[-1] + 1)
+        self.intervalCount += rows.shape[0]
+        self.intervalHasGaps = self.intervalCount < (self.intervalRange[1] -
+                                                     self.intervalRange[0])
+
+    def plotRows(self, entry):
+        '''
+        rows of data to draw for the curve of an entry:
+        rows in the slider interval with minimum and maximum values
+        of the entry for every pixel of the plot width
+        (from the level of detail pyramid of the entry)
+        '''
+        if entry not in self.pyramids:
+            self.pyramids[entry] = LodPyramid(self.findData(entry))
+        width = int(self.plt.getViewBox().width())
+        if width <= 0: width = DEFAULT_PLOT_WIDTH
+        start, stop = self.intervalRange
+        rows = self.pyramids[entry].rows(start, stop, width)
+        if self.intervalHasGaps:
+            rows = rows[self.intervalMask[rows]]
+        return rows
+
+    def plottedRows(self):
+        '''
+        rows drawn in the main plot (by all of its curves), so that
+        plugins draw the same decimated rows of the interval
+        '''
+        entries = self.activeEntries()
+        if entries == []:
+            return np.flatnonzero(self.intervalMask)
+        return np.unique(np.concatenate([self.plotRows(entry)
+                                         for entry in entries]))
+
+    def updateCurves(self, n_new):
+        '''
+        update data of the plotted curves when n_new rows
+        are appended without rebuilding the whole plot.
+        Only the new rows are checked, so the cost does not grow
+        with the length of the data
+        '''
+        if (not self.curves or
+            set(self.curves.keys()) != set(self.activeEntries())):
+            self.updatePlot()
+            return
+        arr = self.findData(self.sliderParam)[-n_new:]
+        old_max = self.sliderMax
+        new_max = max(old_max, arr.max())
+        if new_max > old_max:
+            # the slider stores fractions of the axis, so keep the
+            # interval in data units when the axis grows. An interval
+            # reaching the end of the axis is extended to the new rows
+            interval = self.slider.interval()
+            if interval[1] >= old_max: interval[1] = new_max
+            self.setAxisScale(new_max)
+            self.slider.blockSignals(True)
+            self.slider.setInterval([interval[0]/new_max,
+                                     interval[1]/new_max])
+            self.slider.blockSignals(False)
+            self.updateLimits()
+        self.appendIntervalRows(n_new)
+        for entry, curve in self.curves.items():
+            xdata, ydata = self.curveData(entry)
+            curve.setData(xdata, ydata)
+
     def plotVersusX(self):
         '''
         plot when we have sevaral y's versus of x.
@@ -440,16 +848,13 @@ class DataViewer(QtGui.QWidget):
         data = self.data
         plotlist = self.activeEntries()
         xlabel = self.modparams.param('Parameter').value()
-        null = self.nullFlag.value()
         for i in range(len(plotlist)):
             ylabel = plotlist[i]
             color = self.tree.colors[ylabel].getColor()
             linestyle = pg.mkPen(color=color, width=3)
             yunits = self.findUnits(ylabel)
-            xdata = self.findData(xlabel)[self.indices]
-            ydata = self.findData(ylabel)[self.indices]
-            if null: ydata -= ydata[0]
-            self.plt.plot(xdata, ydata,
+            xdata, ydata = self.curveData(ylabel)
+            self.curves[plotlist[i]] = self.plt.plot(xdata, ydata,
                 pen=linestyle, name=plotlist[i])
             ylabel += " " + yunits
             self.plt.setLabel('left', ylabel, **AXIS_LABEL_STYLE)
@@ -468,17 +873,14 @@ class DataViewer(QtGui.QWidget):
         plotlist = self.activeEntries()
         ylabel = self.modparams.param('Parameter').value()
         yunits = self.findUnits(ylabel)
-        null = self.nullFlag.value()
         for i in range(len(plotlist)):
             xlabel = plotlist[i]
             color = self.tree.colors[xlabel].getColor()
             linestyle = pg.mkPen(color=color, width=3)
-            xdata = self.findData(xlabel)[self.indices]
-            ydata = self.findData(ylabel)[self.indices]
-            if null: xdata -= xdata[0]
+            xdata, ydata = self.curveData(xlabel)
             xunits = self.units[xlabel]
             xlabel += " " + xunits
-            self.plt.plot(xdata, ydata,
+            self.curves[plotlist[i]] = self.plt.plot(xdata, ydata,
                 pen=linestyle, name=plotlist[i])
             self.plt.setLabel('bottom', xlabel,units=xunits,**AxisLabelStyle)
         self.plt.setLabel('left', ylabel,units=yunits,**AxisLabelStyle)
@@ -495,6 +897,8 @@ class DataViewer(QtGui.QWidget):
             xpar = self.trendParameter.value()
             ypar = self.modparams.param('Parameter').value()
         x = self.findData(xpar)[self.indices]
+        # a straight line needs only the end points
+        x = x[[x.argmin(), x.argmax()]]
         y = self.slope*x + self.intersection
         self.plt.plot(x,y,pen=TREND_PEN, name='%s Trend'%(self.trendParameter.value()))
         self.plt.setLabel('bottom', xpar)
@@ -509,6 +913,7 @@ class DataViewer(QtGui.QWidget):
         position = [30, 30]
         # clear plot area
         self.plt.clear()
+        self.curves = {}
         # remove old legend
         if self.legend:
             position = self.legend.pos()
@@ -517,17 +922,19 @@ class DataViewer(QtGui.QWidget):
         self.plt.addLegend([90,20],offset=position)
         self.legend = self.plt.legend
 
-    def setAxisScale(self):
+    def setAxisScale(self, max_value=None):
         '''
         sets scale to the interval axis. if time, sets minimum value to 0,
         because it could have been cleared
+        max_value - maximum of the interval parameter if known
         '''
         interval_parameter = self.sliderParam
-        interval_data = self.findData(interval_parameter)
+        if max_value is None:
+            max_value = self.findData(interval_parameter).max()
         if interval_parameter == self.timeParam:
             min_value = 0
-        self.slider.setRange(min_value,
-                             interval_data.max())
+        self.sliderMax = max_value
+        self.slider.setRange(min_value, max_value)
 
     def activeEntries(self):
         '''
@@ -536,7 +943,7 @@ class DataViewer(QtGui.QWidget):
         plotlist = []
         # for i in self.data.keys():
         #     if self.params.param(i).value() == True:
-        for item in self.keys:
+        for item in self.columnNames():
             if self.tree.boxes[item].value() == True:
                 plotlist.append(item)
         return plotlist
@@ -577,17 +984,25 @@ class DataViewer(QtGui.QWidget):
         self.layout.setMenuBar(self.menuBar)
         # create submenu items
         self.loadButton = QtGui.QAction('Load',self)
+        self.batchLoadButton = QtGui.QAction('Load several files',self)
+        self.previewButton = QtGui.QAction('Preview',self)
         self.saveButton = QtGui.QAction('Save',self)
         self.exitAction = QtGui.QAction('Exit',self,shortcut="Alt+F4")
         self.autoScaleButton = QtGui.QAction('Auto scale',self)
         self.crossHairButton = QtGui.QAction('Cross-hair',self, checkable=True)
+        self.fullResolutionButton = QtGui.QAction('Full resolution interval',self)
+        self.followButton = QtGui.QAction('Follow file',self, checkable=True)
         self.settingsButton = QtGui.QAction('Settings',self)
         # Add buttons to submenus
         self.fileMenu.addAction(self.loadButton)
+        self.fileMenu.addAction(self.batchLoadButton)
+        self.fileMenu.addAction(self.previewButton)
+        self.fileMenu.addAction(self.followButton)
         self.fileMenu.addAction(self.saveButton)
         self.fileMenu.addAction(self.exitAction)
         self.viewMenu.addAction(self.autoScaleButton)
         self.viewMenu.addAction(self.crossHairButton)
+        self.viewMenu.addAction(self.fullResolutionButton)
         self.prefMenu.addAction(self.settingsButton)
         # splitter is a widget, which handles the layout
         # it splits the main window into parameter window
@@ -698,6 +1113,8 @@ class DataViewer(QtGui.QWidget):
         #     event.accept()
         # else:
         #     event.ignore()
+        if self.loadPool is not None:
+            self.loadPool.shutdown(wait=False)
         sys.exit()
 
 
@@ -23,13 +23,28 @@ class MainSettingsWidget(QtGui.QWidget):
         self.timeLine = LineWidget(type='text',label='Time parameter (Do not touch)')
         self.fileHeaderLine = LineWidget(type='text',label='File header parameters')
         self.sampleLengthLine = LineWidget(type='text',label='Sample length parameter')
-        self.maxPointsLine = LineWidget(type='int', label='Maximum points #')
+        self.maxPointsLine = LineWidget(type='int',
+            label='Maximum points # (streamed and previewed files)')
+        self.streamSizeLine = LineWidget(type='int',
+                                         label='Stream files larger than (MB)')
+        self.cacheSizeLine = LineWidget(type='int', label='Cache size (MB)')
+        self.loadedColumnsLine = LineWidget(type='text',
+            label='Columns read at once (others when plotted, empty - all)')
         self.layout.addWidget(self.sliderLine)
         self.layout.addWidget(self.timeLine)
         self.layout.addWidget(self.fileHeaderLine)
         self.layout.addWidget(self.sampleLengthLine)
         self.layout.addWidget(self.maxPointsLine)
+        self.layout.addWidget(self.streamSizeLine)
+        self.layout.addWidget(self.cacheSizeLine)
+        self.sonicBitsLine = LineWidget(type='int',
+            label='Bits per sonic sample (8 or 16, 0 - not compressed)')
+        self.layout.addWidget(self.loadedColumnsLine)
+        self.layout.addWidget(self.sonicBitsLine)
         self.maxPointsLine.box.setRange(1e2, 1e7)
+        self.streamSizeLine.box.setRange(1, 1e5)
+        self.cacheSizeLine.box.setRange(0, 1e6)
+        self.sonicBitsLine.box.setRange(0, 16)
         self.buttonsWidget = QtGui.QWidget()
         self.layout.addWidget(self.buttonsWidget)
         self.buttonsLayout = QtGui.QHBoxLayout()
@@ -46,6 +61,10 @@ class MainSettingsWidget(QtGui.QWidget):
         self.fileHeaderLine.setValue(config['fileheader'])
         self.sampleLengthLine.setValue(config['SampleLengthParameter'])
         self.maxPointsLine.setValue(int(config['MaxDataPoints']))
+        self.streamSizeLine.setValue(int(config['StreamingFileSize']))
+        self.cacheSizeLine.setValue(int(config['CacheSize']))
+        self.loadedColumnsLine.setValue(config['LoadedColumns'])
+        self.sonicBitsLine.setValue(int(config['SonicBits']))
         self.conf = config
 
     def config(self):
@@ -54,11 +73,19 @@ class MainSettingsWidget(QtGui.QWidget):
         fileHeaderText = self.fileHeaderLine.value()
         slengthpar = self.sampleLengthLine.value()
         max_points = self.maxPointsLine.value()
+        stream_size = self.streamSizeLine.value()
+        cache_size = self.cacheSizeLine.value()
+        loaded_columns = self.loadedColumnsLine.value()
+        sonic_bits = self.sonicBitsLine.value()
         self.conf['slider'] = slider
         self.conf['time'] = time
         self.conf['fileheader'] = fileHeaderText
         self.conf['SampleLengthParameter'] = slengthpar
         self.conf['MaxDataPoints'] = max_points
+        self.conf['StreamingFileSize'] = stream_size
+        self.conf['CacheSize'] = cache_size
+        self.conf['LoadedColumns'] = loaded_columns
+        self.conf['SonicBits'] = sonic_bits
         return self.conf
 
     def getHeaderExpr(self,text=None):
@@ -3,7 +3,6 @@ import sys,os
 import pyqtgraph as pg
 import pickle
 from PySide import QtGui, QtCore
-from copy import copy
 from pyqtgraph.parametertree import Parameter, ParameterTree
 from pyqtgraph.parametertree import types as pTypes
 from pyqtgraph.Point import Point
@@ -11,7 +10,10 @@ import numpy as np
 
 # custom modules
 from TCI.base_classes.MultiLine import MultiLine
+from TCI.base_classes.SonicTable import SonicTable
+from TCI.base_classes.PickingCache import PickingCache
 from TCI.lib.functions import *
+from TCI.lib.functions import natural_keys
 from TCI.styles.Gradients import Gradients
 from TCI.styles.setup_plot import setup_plot
 from TCI.base_widgets.ViewBox import ViewBox
@@ -20,15 +22,19 @@ from TCI.base_widgets.TriplePlotWidget import TriplePlotWidget
 from TCI.base_widgets.GradientEditorWidget import GradientEditorWidget
 from TCI.lib.logger import logger
 from TCI.calculations.fft import get_fft
+from TCI.calculations.pickers import pick_arrivals, consecutive_delays
+from TCI.calculations.pickers import anchor_delays
+from TCI.calculations.lines import detect_fronts
 
 # styles
-from TCI.styles.LineColors import ARRIVALS_PEN
+from TCI.styles.LineColors import ARRIVALS_PEN, FRONTS_PEN
 from TCI.styles.LabelStyles import AXIS_LABEL_STYLE
 
 X_LABEL = 'Oscilloscope time (μs)'
 fXAxisName = 'Frequency (MHz)'
 phXAxisName = 'Phase (deg)'
 N_COLORS = 100
+PICKING_CACHE_SIZE = 32  # picking results kept for every setting
 
 Parameters = [
     {'name': 'Show', 'type': 'bool', 'value': True, 'tip': "Press to plot wave"},
@@ -51,7 +57,6 @@ class SonicViewer(QtGui.QWidget):
     '''
     # mode = 'Contours'
     mode = 'WaveForms'
-    autoShift = {'P':True,'Sx':True,'Sy':True} # flag to match 0 and transmission time
     arrivalsPicked = False
     updateQTable = True # don't need
     skipPlottingFAmpFlag = False
@@ -73,7 +78,11 @@ class SonicViewer(QtGui.QWidget):
         # self.phWidget = TriplePlotWidget()
         # self.bWidget = BindingWidget(parents=[parent, self])
         # self.isWidget = InterpretationSettingsWidget()
-        self.data = {'P':{}, 'Sx':{}, 'Sy':{}}
+        # file names of the tracks (rows of the table)
+        self.names = {'P':[], 'Sx':[], 'Sy':[]}
+        # candidate fronts: wave -> (shown tracks, arrival times)
+        self.fronts = {}
+        self.pickingCache = PickingCache(PICKING_CACHE_SIZE)
         # self.connectPlotButtons()
         self.gradEditor = GradientEditorWidget()
         self.gradEditor.waveGradientWidget.restoreState(Gradients['hot'])
@@ -84,7 +93,8 @@ class SonicViewer(QtGui.QWidget):
         # self.allParameters = []
         # self.yAxis = 'Track #'
         self.y = {}
-        # self.aTimes = {}
+        # arrival times from multi-window picking: wave -> array
+        self.aTimes = {}
         # Connect everything
         # self.showArrivalsButton.triggered.connect(self.parent.plotSonicData)
         # self.pickArrivalsButton.triggered.connect(self.pickAllArrivals)
@@ -148,13 +158,33 @@ class SonicViewer(QtGui.QWidget):
     def setRawData(self, data):
         '''
         data is a dictionary with keys: P,Sx,Sy
+        it is not kept, the tracks are stored in the tables
         '''
+        self.createTable(data)
+        self.arrivalsPicked = False
+
+    def setArchive(self, archive):
+        '''
+        set data from an opened SonicArchive instead of raw data
+        '''
+        self.table = {}
         for wave in WaveTypes:
-            self.data[wave] = data[wave]
-        self.createTable()
-        self.getFourrierTransforms()
+            self.names[wave] = list(archive.names[wave])
+            self.table[wave] = archive.table(wave)
+            self.y[wave] = np.arange(len(self.table[wave]))
         self.arrivalsPicked = False
 
+    def removeTracks(self, wave, tracks):
+        '''
+        remove rows of the table, e.g. tracks that are not
+        bound to the geomechanical data
+        '''
+        keep = np.ones(len(self.names[wave]), dtype=bool)
+        keep[tracks] = False
+        self.names[wave] = [n for n, k in zip(self.names[wave], keep) if k]
+        self.table[wave].removeTracks(tracks)
+        self.y[wave] = np.arange(len(self.table[wave]))
+
     def setSonicTable(self, table, y=None):
         '''
         set already processed sonic data
@@ -162,7 +192,7 @@ class SonicViewer(QtGui.QWidget):
         self.table = table
         if y is None:
             for wave in WaveTypes:
-                self.y[wave] = np.arange(self.table[wave].shape[1])
+                self.y[wave] = np.arange(len(self.table[wave]))
         else:
             self.y = y
 
@@ -180,24 +210,33 @@ class SonicViewer(QtGui.QWidget):
         check if the viewer has data to work with
         '''
         for wave in WaveTypes:
-            if len(self.data[wave])>0: return True
+            if len(self.names[wave])>0: return True
         return False
 
-    def createTable(self):
+    def createTable(self, data):
         '''
-        store all data in one 3D np-array
-        1st dimension - time or amplitude
-        2nd dimension - number of file
-        3rd dimension - datapoints
+        store data of each wave in a SonicTable
+        (memory-mapped, tracks are read when needed)
+        data - wave -> file name -> (n_samples, 2) array
         '''
+        for wave in WaveTypes:
+            self.names[wave] = sorted(data[wave].keys(), key=natural_keys)
         if not self.hasData(): return 0 # if no data pass
         logger.info('Building sonic matrix')
+        bits = 0
+        if self.parent is not None:
+            config = self.parent.settings.config()['Main parameters']
+            bits = int(config['SonicBits'])
         ### add some function that checks for constant dt
         # if dt is not uniform, interpolate data and add some points
         self.table = {}
         for wave in WaveTypes:
-            self.table[wave] = get_table(self.data[wave])
-            self.y[wave] = np.arange(self.table[wave].shape[1])
+            self.table[wave] = SonicTable.fromDict(data[wave])
+            if bits > 0:
+                self.table[wave].quantize(bits)
+            # resampled tracks stay, dropped ones are removed
+            self.names[wave] = self.table[wave].names
+            self.y[wave] = np.arange(len(self.table[wave]))
 
     def showFFTAmplitude(self):
         self.plot_fft_phase = False
@@ -216,17 +255,6 @@ class SonicViewer(QtGui.QWidget):
         self.fftWidget.activateWindow()
         self.plot()
 
-    def getFourrierTransforms(self):
-        if not self.hasData(): return 0 # if no data pass
-        logger.info('Building Fourrier matrix')
-        self.fft = {} # fourrier transform
-        self.fftamp = {} # power
-        self.fftph = {} # phase
-        for wave in WaveTypes:
-            x = self.table[wave][0,:,:]
-            y = self.table[wave][1,:,:]
-            [self.fft[wave], self.fftamp[wave], self.fftph[wave]] = get_fft(x, y)
-
     def connectPlotButtons(self):
         for wave in WaveTypes:
             self.params[wave].param('Show').sigValueChanged.connect(self.changeLayout)
@@ -274,13 +302,14 @@ class SonicViewer(QtGui.QWidget):
         ifft = {}
         interval = self.fWidget.interval()
         for wave in WaveTypes:
-            x = self.table[wave][0,:,:]
-            xf = self.fft[wave][0,:,:]
-            yf = copy(self.fft[wave][1,:,:])
-            yf[abs(xf)<min(interval)] = 0
-            yf[abs(xf)>max(interval)] = 0
+            # transform only the tracks that are shown
+            x = self.table[wave].times(self.indices[wave])
+            y = self.table[wave].amplitudes(self.indices[wave])
+            xf, yf = get_fft(x, y)[0]
+            yf[:, abs(xf)<min(interval)] = 0
+            yf[:, abs(xf)>max(interval)] = 0
             ift = np.fft.ifft(yf)
-            ifft[wave] = np.array((x,ift.real))
+            ifft[wave] = (x, ift.real)
         return ifft
 
     def getYArray(self, wave):
@@ -304,8 +333,7 @@ class SonicViewer(QtGui.QWidget):
         else:
             ylabel = self.controller.yLabel()
             if ylabel == "Track #":
-                data = self.table[wave]
-                y = np.r_[0: data.shape[1]]
+                y = np.r_[0: len(self.table[wave])]
             else:
                 y = self.parent.findData(ylabel)[self.controller.geo_indices[wave]]
             return y
@@ -340,16 +368,18 @@ class SonicViewer(QtGui.QWidget):
             ind = self.indices[wave]
             y = self.getYArray(wave)
 
-            data = self.table[wave][:, ind,:]
+            # read only the tracks that are plotted
+            data = (self.table[wave].times(ind),
+                    self.table[wave].amplitudes(ind))
+            if data[1].shape[0] == 0: continue  # skip empty plot
 
             fft_data = None
             if self.fftWidget.isVisible():
+                fft, fft_amplitude, fft_phase = get_fft(*data)
                 if self.plot_fft_amplitude:
-                    fft_data = self.fftamp[wave][:, ind,:]
+                    fft_data = fft_amplitude
                 if self.plot_fft_phase:
-                    fft_data = self.fftph[wave][:, ind,:]
-
-            if data.shape[1] == 0: continue  # skip empty plot
+                    fft_data = fft_phase
 
             # ACTUAL PLOTTING
             if self.mode == 'WaveForms':
@@ -374,25 +404,36 @@ class SonicViewer(QtGui.QWidget):
                 x = self.arrival_times[wave][self.indices[wave]]
                 self.plots[wave].plot(x, y, pen=ARRIVALS_PEN)
 
+            # plot candidate fronts if they belong to the shown tracks
+            if (wave in self.fronts.keys() and
+                np.array_equal(self.fronts[wave][0], ind)):
+                for k, front in enumerate(self.fronts[wave][1]):
+                    curve = pg.PlotCurveItem(front, y, pen=FRONTS_PEN,
+                                             clickable=True)
+                    curve.sigClicked.connect(
+                        lambda *args, wave=wave, k=k: self.selectFront(wave, k))
+                    self.plots[wave].addItem(curve)
+
 
     def plotWaveForms(self, data, plot_widget, y_array, amplify=None):
         '''
         input:
-        data - np.array(2, n_tracks, track_length)
+        data - pair of x (track_length) or (n_tracks, track_length)
+        and y (n_tracks, track_length)
         plot_widget - pyqtgraph.plotItem that hold the image
         y_array - array of geomechanical data
         amplify - float, amplification coefficient (y-stretch of wave forms)
         '''
         # compute amplification
         if amplify is None:
-            amplify = np.abs(np.diff(y_array)).max()/data[1, :, :].max()
+            amplify = np.abs(np.diff(y_array)).max()/data[1].max()
 
         # generate array to plot
-        n_lines = data.shape[1]
-        y = amplify*data[1,:,:] + y_array.reshape(n_lines, 1)
+        n_lines = data[1].shape[0]
+        y = amplify*data[1] + y_array.reshape(n_lines, 1)
 
         # convert array to a graphical path
-        graphic_path = MultiLine(data[0, :, :], y)
+        graphic_path = MultiLine(data[0], y)
         try:
             plot_widget.addItem(graphic_path)
         except: pass
@@ -400,17 +441,18 @@ class SonicViewer(QtGui.QWidget):
     def plotContours(self, data, plot_widget, y_array, lut=None):
         '''
         input:
-        data - np.array(2, n_tracks, track_length)
+        data - pair of x (track_length) or (n_tracks, track_length)
+        and y (n_tracks, track_length)
         plot_widget - pyqtgraph.plotItem that hold the image
         y_array - array of geomechanical data
         lut - lookup table for colors
         '''
         image = pg.ImageItem()
-        image.setImage(data[1, :, :].T)
+        image.setImage(data[1].T)
         plot_widget.addItem(image)
 
         # scale image
-        x = data[0, 0, :]
+        x = np.atleast_2d(data[0])[0]
         shiftX0 = x[0]
         scaleX = (x[-1] - x[0])/x.shape[0]
         ymax = y_array.max()
@@ -432,6 +474,112 @@ class SonicViewer(QtGui.QWidget):
         self.arrival_times = arrival_times
         self.arrivalsPicked = True
 
+    def autoPickArrivals(self, method='AIC', interval=None, **params):
+        '''
+        pick arrivals of all tracks with one of the pickers
+        in calculations.pickers and set them as arrival times.
+        Tracks are read from the tables in chunks
+        interval - (start, stop) oscilloscope time to search in
+        '''
+        logger.info('Picking arrival times with %s'%(method))
+        arrival_times = {}
+        for wave in WaveTypes:
+            table = self.table[wave]
+            arrivals = np.empty(len(table))
+            arrivals[:] = np.nan
+            if interval is not None: interval = tuple(interval)
+            settings = (interval, tuple(sorted(params.items())))
+            for start in range(0, len(table), table.chunk_size):
+                ind = np.arange(start, min(start + table.chunk_size,
+                                           len(table)))
+                arrivals[ind] = self.cachedPick(
+                    wave, method, settings, ind,
+                    lambda: pick_arrivals(table.times(ind),
+                                          table.amplitudes(ind),
+                                          method, interval, **params),
+                    transmitter=True)
+            arrival_times[wave] = arrivals
+        self.setArrivalTimes(arrival_times)
+        self.plot_arrival_times_flag = True
+
+    def detectFronts(self, n_lines=5):
+        '''
+        find candidate arrival and transmitter fronts on the tracks
+        shown with a Hough transform of their edge map
+        (see calculations.lines) and draw them.
+        Clicking a front sets it as the arrival times
+        '''
+        self.fronts = {}
+        for wave in self.getActivePlots():
+            ind = self.indices[wave]
+            if len(ind) < 2: continue
+            logger.info('Detecting fronts of %s wave'%(wave))
+            arrivals = detect_fronts(self.table[wave].times(ind),
+                                     self.table[wave].amplitudes(ind),
+                                     n_lines)[2]
+            self.fronts[wave] = (np.array(ind), arrivals)
+        self.plot()
+
+    def selectFront(self, wave, k):
+        '''
+        set arrival times of the shown tracks of wave from
+        the front k found by detectFronts
+        '''
+        ind, arrivals = self.fronts.pop(wave)
+        arrival_times = {}
+        if self.arrivalsPicked:
+            arrival_times.update(self.arrival_times)
+        arrival_times[wave] = np.empty(len(self.table[wave]))
+        arrival_times[wave][:] = np.nan
+        arrival_times[wave][ind] = arrivals[k]
+        self.setArrivalTimes(arrival_times)
+        self.plot_arrival_times_flag = True
+        if self.controller is not None:
+            self.controller.showPickedArrivals()
+        else:
+            self.plot()
+
+    def relativePickArrivals(self, method='AIC', interval=None,
+                             n_anchors=3, max_lag=None):
+        '''
+        arrival times of all tracks from cross-correlation delays
+        between consecutive tracks, anchored to arrivals on n_anchors
+        evenly spaced tracks. Anchors keep the arrivals picked before
+        (e.g. shape or hand pick), otherwise they are picked with method
+        interval - (start, stop) oscilloscope time that is correlated
+        max_lag - largest delay between consecutive tracks (samples)
+        '''
+        logger.info('Relative picking of arrival times')
+        arrival_times = {}
+        for wave in WaveTypes:
+            table = self.table[wave]
+            n_tracks = len(table)
+            arrival_times[wave] = np.empty(n_tracks)
+            arrival_times[wave][:] = np.nan
+            if n_tracks == 0: continue
+            # chunks overlap by one track to link their delays
+            delays = np.zeros(n_tracks)
+            for start in range(0, n_tracks - 1, table.chunk_size):
+                ind = np.arange(start, min(start + table.chunk_size + 1,
+                                           n_tracks))
+                delays[ind] = delays[start] + consecutive_delays(
+                    table.times(ind), table.amplitudes(ind), interval,
+                    max_lag)
+            anchors = np.unique(np.linspace(0, n_tracks - 1,
+                                            n_anchors).round().astype(int))
+            picks = np.empty(anchors.shape[0])
+            picks[:] = np.nan
+            if self.arrivalsPicked and wave in self.arrival_times.keys():
+                picks = self.arrival_times[wave][anchors]
+            if np.isnan(picks).all():
+                picks = pick_arrivals(table.times(anchors),
+                                      table.amplitudes(anchors),
+                                      method, interval)
+            arrival_times[wave] = anchor_delays(table.times(), delays,
+                                                anchors, picks)
+        self.setArrivalTimes(arrival_times)
+        self.plot_arrival_times_flag = True
+
 
     def setYAxisParameters(self,parameters):
         # we use setLimits because of weird implementation
@@ -491,29 +639,70 @@ class SonicViewer(QtGui.QWidget):
     def setupArrivalsSettingsWidgets(self):
         pass
 
+    def cachedPick(self, wave, picker, params, indices, pick,
+                   transmitter=False):
+        '''
+        result of pick() for the tracks of wave with the given indices.
+        It is stored in the picking cache, so picking again with the
+        same picker and params on the same table returns it at once
+        transmitter - whether the result depends on the transmitter time
+        '''
+        key = PickingCache.key(wave, picker, params, self.table[wave],
+                               indices, transmitter)
+        result = self.pickingCache.get(key)
+        if result is None:
+            result = pick()
+            self.pickingCache.put(key, result)
+        return result
+
+    def multiWindowPick(self, wave, ind, mpoint, win):
+        '''
+        sender and receiver times of the tracks with indices ind
+        (oscilloscope time without the transmitter shift)
+        '''
+        x = np.atleast_2d(self.table[wave].times(ind, transmitter=False))[0]
+        y = self.table[wave].amplitudes(ind)
+        h = x[1] - x[0]
+        r = multi_window(y,win)
+        rx = np.arange(r.shape[1])*h + x[win[0]]
+        mind = abs(rx-mpoint).argmin() #index of middle point
+        sInd = r[:,:mind].argmax(axis=1) # sender indices
+        sTimes = rx[sInd] # sender times
+        rInd = r[:,mind:].argmax(axis=1) # receiver indices
+        rTimes = rx[mind+rInd]
+        return sTimes, rTimes
+
     def pickArrivals(self,wave):
+        '''
+        pick sender and arrival times of the shown tracks of wave
+        with multi_window (settings in the Arrival times parameters),
+        move the sender pulse of every track to zero time and set
+        the arrival times
+        '''
         logger.info('Computing arrival times for %s wave'%(wave))
         win = [0,0,0]
         mpoint = self.params[wave].param('Arrival times').param('Mpoint').value()
         win[0] = self.params[wave].param('Arrival times').param('BTA').value()
         win[1] = self.params[wave].param('Arrival times').param('ATA').value()
         win[2] = self.params[wave].param('Arrival times').param('DTA').value()
-        x = self.table[wave][0,:,:]
-        y = self.table[wave][1,:,:]
-        h = x[0,1] - x[0,0]
-        r = multi_window(y,win)
-        rx = np.arange(r.shape[1])*h + x[0,win[0]]
-        mind = abs(rx-mpoint).argmin() #index of middle point
-        sInd = r[:,:mind].argmax(axis=1) # sender indices
-        sTimes = rx[sInd] # sender times
-        rInd = r[:,mind:].argmax(axis=1) # receiver indices
-        rTimes = rx[mind+rInd]
-        self.aTimes[wave] = rTimes - sTimes
-        # shift initial data so
-        if self.autoShift[wave]:
-            shift = np.mean(sTimes)
-            self.table[wave][0,:,:] -= shift
-            self.autoShift[wave] = False
+        # pick only the tracks that are shown
+        ind = self.indices[wave]
+        sTimes, rTimes = self.cachedPick(
+            wave, 'multi_window', (mpoint,) + tuple(win), ind,
+            lambda: self.multiWindowPick(wave, ind, mpoint, win))
+        self.aTimes[wave] = np.empty(len(self.table[wave]))
+        self.aTimes[wave][:] = np.nan
+        self.aTimes[wave][ind] = rTimes - sTimes
+        # move the transmitter pulse of every picked track to zero time.
+        # It replaces the previous transmitter time, so picking again
+        # does not shift the tracks further
+        self.table[wave].setTransmitter(sTimes, indices=ind)
+        arrival_times = {}
+        if self.arrivalsPicked:
+            arrival_times.update(self.arrival_times)
+        arrival_times[wave] = self.aTimes[wave]
+        self.setArrivalTimes(arrival_times)
+        self.plot_arrival_times_flag = True
 
     def editArrivals(self):
         data = self.QTable.getValues()